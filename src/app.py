@@ -25,6 +25,7 @@ init_session_state()
 # --- Lightweight Imports (โหลดเร็ว) ---
 from modules.languages import get_text, get_lesson
 from modules.ui import inject_custom_css, render_pro_credit
+from modules.config import API_URL  # set = thin client of src/server.py
 
 # Inject CSS with light theme
 inject_custom_css("light")
@@ -37,10 +38,22 @@ def get_cached_vector_db(db_name):
     return load_vector_db(db_name)
 
 @st.cache_resource
-def get_cached_llm(api_key):
-    """Cache LLM instance"""
+def get_cached_llm(api_key, cache=True):
+    """Cache LLM instance (cache=False: one that skips the LLM cache, for A/B timing)"""
     from modules.llm import get_llm
-    return get_llm(api_key)
+    return get_llm(api_key, cache)
+
+@st.cache_resource
+def get_cached_api_client(api_key):
+    """One HTTP client (connection pool) per key for the query service"""
+    from modules.api_client import ApiClient
+    return ApiClient(API_URL, api_key)
+
+@st.cache_resource
+def get_cached_answer_cache():
+    """One SQLite-backed answer cache shared by all sessions"""
+    from modules.answer_cache import AnswerCache
+    return AnswerCache()
 
 @st.cache_data(ttl=600)
 def get_cached_file_list():
@@ -48,12 +61,17 @@ def get_cached_file_list():
     from modules.database import get_file_list
     return get_file_list()
 
-@st.cache_data(ttl=600)
-def get_cached_file_content(filename):
-    """Cache file content"""
+def get_file_content(filename):
+    """File text, sliced from the shared mmap docstore (no per-file st.cache_data copy)"""
     from modules.database import get_full_file_content
     return get_full_file_content(filename)
 
+@st.cache_resource
+def load_cached_tokenizer():
+    """Fetch (once, with a timeout) and load the tokenizer before the first query"""
+    from modules.cost import load_tokenizer
+    return load_tokenizer(download=True)
+
 # --- Auto-Ingest Fail-safe (Utility) ---
 @st.cache_resource
 def ensure_database_exists():
@@ -148,8 +166,10 @@ def render_dashboard():
             st.session_state['render_tech_flowchart'] = render_tech_flowchart
             st.session_state['heavy_modules_loaded'] = True
             
-            # Check DB (cached)
-            ensure_database_exists()
+            # Check DB (cached); the query service owns it in thin-client mode
+            if not API_URL:
+                ensure_database_exists()
+                load_cached_tokenizer()
     
     # Retrieve from session state
     TECHNIQUE_INFO = st.session_state['TECHNIQUE_INFO']
@@ -180,19 +200,23 @@ def render_dashboard():
         st.markdown("---")
         
         # Use cached vector DB
-        try:
-            vector_db = get_cached_vector_db("harry_potter_lore")
-            st.success("Database Connected")
-        except Exception as e:
-            st.error(f"Database Error: {str(e)}")
+        if API_URL:
             vector_db = None
+            st.success(f"Query Service: {API_URL}")
+        else:
+            try:
+                vector_db = get_cached_vector_db("harry_potter_lore")
+                st.success("Database Connected")
+            except Exception as e:
+                st.error(f"Database Error: {str(e)}")
+                vector_db = None
             
         with st.expander("Data Explorer"):
             files = get_cached_file_list()  # Cached
             if files:
                 f = st.selectbox("File", files)
                 if st.button(get_text(lang, 'btn_read')):
-                    content = get_cached_file_content(f)  # Cached
+                    content = get_file_content(f)  # mmap docstore
                     st.text_area("Content", content, height=300)
         st.markdown("---")
         render_pro_credit(in_sidebar=True)
@@ -260,6 +284,10 @@ def render_chat_tab(lang, TECHNIQUE_INFO, PIPELINE_PRESETS, vector_db, set_prese
             for t in all_techs[mid:]:
                 st.checkbox(t, key=f"chk_{t}", on_change=make_callback())
 
+        from modules.config import RERANKER_BACKENDS, COMPRESSION_BACKENDS
+        st.selectbox(get_text(lang, 'reranker'), RERANKER_BACKENDS, key="reranker_backend")
+        st.selectbox(get_text(lang, 'compressor'), COMPRESSION_BACKENDS, key="compressor_backend")
+
     with c_chat:
         chat_box = st.container(height=600)
         
@@ -270,8 +298,10 @@ def render_chat_tab(lang, TECHNIQUE_INFO, PIPELINE_PRESETS, vector_db, set_prese
                     st.markdown(m["content"], unsafe_allow_html=True)
                     if "meta" in m:
                         meta = m['meta']
-                        with st.expander(f"{get_text(lang, 'analysis')} ({meta['lat']:.2f}s | ${meta['cost']:.5f})"):
-                            tabs = st.tabs([get_text(lang, 'logs'), get_text(lang, 'context')])
+                        cached = " | ⚡ cached" if meta.get('cached') else ""
+                        ttft = f" | TTFT {meta['ttft']:.2f}s" if 'ttft' in meta else ""
+                        with st.expander(f"{get_text(lang, 'analysis')} ({meta['lat']:.2f}s{ttft} | ${meta['cost']:.5f}{cached})"):
+                            tabs = st.tabs([get_text(lang, 'logs'), get_text(lang, 'context'), get_text(lang, 'trace')])
                             with tabs[0]:
                                 for l in meta['logs']:
                                     st.markdown(f"<div class='log-entry'>{l}</div>", unsafe_allow_html=True)
@@ -281,6 +311,21 @@ def render_chat_tab(lang, TECHNIQUE_INFO, PIPELINE_PRESETS, vector_db, set_prese
                                     src = d.metadata.get('source_doc', 'Unknown')
                                     content_preview = d.page_content[:250]
                                     st.markdown(f"<div class='source-ref'><b>{src}</b> <span style='float:right;color:#059669'>Score: {sc:.1f}</span><br>{content_preview}...</div>", unsafe_allow_html=True)
+                            with tabs[2]:
+                                trace = meta.get('trace')
+                                if trace is not None:
+                                    from modules.visuals import render_trace_waterfall
+                                    render_trace_waterfall(trace)
+                                    tok_in, tok_out = trace.tokens
+                                    est = "~" if any(s.estimated_calls for s in trace.spans) else ""  # counted locally, not by the provider
+                                    st.caption(f"🤖 {trace.llm_calls} LLM calls | {est}{tok_in} prompt / {est}{tok_out} completion tokens | 💰 {est}${trace.cost:.5f}")
+                                    from modules.cost import cost_breakdown
+                                    st.dataframe(cost_breakdown(trace.spans), hide_index=True, use_container_width=True)
+                                    st.download_button(
+                                        "⬇️ OpenTelemetry JSON", trace.to_json(),
+                                        file_name=f"trace_{trace.trace_id}.json", mime="application/json",
+                                        key=f"otel_{trace.trace_id}"
+                                    )
         
         # Chat input
         if q := st.chat_input(get_text(lang, 'placeholder')):
@@ -292,32 +337,59 @@ def render_chat_tab(lang, TECHNIQUE_INFO, PIPELINE_PRESETS, vector_db, set_prese
             with chat_box:
                 with st.chat_message("assistant"):
                     api_key = st.session_state["groq_api_key"]
-                    with st.spinner(get_text(lang, 'running')):
-                        from modules.rag_pipeline import perform_rag
-                        
+                    from modules.answer_cache import is_cache_hit
+                    
+                    techs = get_selected_techs()
+                    if API_URL:
+                        events = get_cached_api_client(api_key).stream_query(
+                            st.session_state.msgs[-1]["content"],
+                            techs,
+                            reranker=st.session_state["reranker_backend"],
+                            compressor=st.session_state["compressor_backend"]
+                        )
+                    else:
+                        from modules.rag_pipeline import stream_rag
                         llm = get_cached_llm(api_key)  # Use cached LLM
-                        techs = get_selected_techs()
-                        ans, docs, lat, tok, cost, logs = perform_rag(
+                        events = stream_rag(
                             st.session_state.msgs[-1]["content"], 
                             vector_db, 
                             llm, 
-                            techs
+                            techs,
+                            reranker=st.session_state["reranker_backend"],
+                            answer_cache=get_cached_answer_cache(),
+                            compressor=st.session_state["compressor_backend"]
                         )
-                        
-                        final = f"{ans}\n\n---\n<small style='color:grey'>Strategy: {st.session_state['active_mode']}</small>"
-                        st.markdown(final, unsafe_allow_html=True)
-                        
-                        st.session_state.msgs.append({
-                            "role": "assistant", 
-                            "content": final, 
-                            "meta": {
-                                "lat": lat, 
-                                "docs": docs, 
-                                "cost": cost, 
-                                "logs": logs
-                            }
-                        })
-                        st.rerun()
+                    
+                    # Logs go into a live status box, answer tokens are streamed below it
+                    status = st.status(get_text(lang, 'running'))
+                    result = {}
+                    def answer_tokens():
+                        for kind, payload in events:
+                            if kind == "log":
+                                status.write(payload)
+                            elif kind == "token":
+                                yield payload
+                            else:
+                                result.update(payload)
+                    st.write_stream(answer_tokens())
+                    status.update(state="complete")
+                    
+                    final = f"{result['answer']}\n\n---\n<small style='color:grey'>Strategy: {st.session_state['active_mode']}</small>"
+                    
+                    st.session_state.msgs.append({
+                        "role": "assistant", 
+                        "content": final, 
+                        "meta": {
+                            "lat": result['lat'], 
+                            "ttft": result['ttft'],
+                            "docs": result['docs'], 
+                            "cost": result['cost'], 
+                            "logs": result['logs'],
+                            "trace": result['trace'],
+                            "cached": is_cache_hit(result['logs'])
+                        }
+                    })
+                    st.rerun()
 
 def render_ab_tab(lang, TECHNIQUE_INFO, PIPELINE_PRESETS, vector_db):
     """Render A/B testing tab"""
@@ -345,34 +417,42 @@ def render_ab_tab(lang, TECHNIQUE_INFO, PIPELINE_PRESETS, vector_db):
                 for t in TECHNIQUE_INFO:
                     if st.checkbox(t, key=f"{prefix}_{t}"):
                         selected.append(t)
-                return selected
+                reranker = st.selectbox(get_text(lang, 'reranker'), RERANKER_BACKENDS, key=f"{prefix}_reranker")
+                return selected, reranker
     
-    techs_a = render_ab_col("pipe_a", "Pipeline A", c1)
-    techs_b = render_ab_col("pipe_b", "Pipeline B", c2)
+    from modules.config import RERANKER_BACKENDS
+    techs_a, reranker_a = render_ab_col("pipe_a", "Pipeline A", c1)
+    techs_b, reranker_b = render_ab_col("pipe_b", "Pipeline B", c2)
     
     st.divider()
     q_ab = st.text_input("Query", key="ab_query")
     
     if st.button(get_text(lang, 'btn_compare'), type="primary") and q_ab:
-        from modules.rag_pipeline import perform_rag
-        
         api_key = st.session_state["groq_api_key"]
-        llm = get_cached_llm(api_key)  # Use cached LLM
+        
+        # Both pipelines run at the same time; shared leading stages run once
+        with st.spinner("Processing..."):
+            if API_URL:
+                res_a, res_b, shared = get_cached_api_client(api_key).compare_pipelines(q_ab, techs_a, techs_b, reranker_a, reranker_b)
+            else:
+                from modules.rag_pipeline import compare_pipelines
+                llm = get_cached_llm(api_key, cache=False)  # A/B compares real latency, no cache hits
+                res_a, res_b, shared = compare_pipelines(q_ab, vector_db, llm, techs_a, techs_b, reranker_a, reranker_b)
+        
         ca, cb = st.columns(2)
         
-        def run_side(col, techs, label):
+        def render_side(col, result, label):
             with col:
                 st.markdown(f"### {label}")
-                with st.spinner("Processing..."):
-                    a, d, l, t, c, logs = perform_rag(q_ab, vector_db, llm, techs)
-                    st.markdown(a)
-                    st.caption(f"⏱️ {l:.2f}s | 💰 ${c:.5f}")
-                    with st.expander("Logs"):
-                        for log in logs:
-                            st.code(log, language="text")
+                a, d, l, t, c, logs = result
+                st.markdown(a)
+                st.caption(f"⏱️ {l:.2f}s (+{shared['lat']:.2f}s shared) | 🪙 {t} tokens | 💰 ${c:.5f} (+${shared['cost']:.5f} shared)")
+                with st.expander("Logs"):
+                    for log in logs:
+                        st.code(log, language="text")
         
-        run_side(ca, techs_a, "Pipeline A")
-        run_side(cb, techs_b, "Pipeline B")
+        render_side(ca, res_a, "Pipeline A")
+        render_side(cb, res_b, "Pipeline B")
 
 def render_learn_tab(lang, TECHNIQUE_INFO, render_tech_flowchart):
     """Render learning/tutorial tab"""
@@ -0,0 +1,191 @@
+"""
+Benchmark the ingest pipeline on a synthetic corpus.
+
+The corpus is `--scale` copies of every file in data/ (paragraphs shuffled
+per copy so chunks differ). Each (batch size, workers) pair runs in a fresh
+subprocess against a throwaway Chroma store, so peak memory is per run.
+Reports per-stage seconds (load, split, embed, write), chunks/sec, MB/sec
+and peak RSS, then writes everything to <out>.json and <out>.csv.
+The embedding workers are started and their models loaded before the
+clock starts (reported separately as startup_s), and the clock stops
+before they shut down, so chunks/sec is steady-state throughput at any scale.
+
+    python src/benchmarks/bench_ingest.py --scale 20 --batch-sizes 64,256,1024 --workers 1,2,4
+    python src/benchmarks/bench_ingest.py --embedder hash   # pipeline overhead only, no model
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from functools import partial
+
+# Fix path to allow importing modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from modules.config import DATA_FOLDER, EMBEDDING_MODEL, INGEST_WRITERS
+
+TARGET_SCALE = 1000  # the corpus size we are sizing nodes for, relative to data/
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic unit vectors from a text hash: isolates read/split/write cost from the model."""
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+        v = np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32)
+        return (v / np.linalg.norm(v)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def embedding_factory(kind):
+    if kind == "hash":
+        return HashEmbeddings
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return partial(HuggingFaceEmbeddings, model_name=EMBEDDING_MODEL)
+
+
+def build_corpus(target_dir, scale, seed=0):
+    """Write `scale` shuffled copies of data/*.txt into target_dir; return total bytes."""
+    sources = sorted(f for f in os.listdir(DATA_FOLDER) if f.endswith(".txt"))
+    total = 0
+    for fname in sources:
+        with open(os.path.join(DATA_FOLDER, fname), "r", encoding="utf-8") as f:
+            paragraphs = f.read().split("\n\n")
+        stem = fname[:-4]
+        for i in range(scale):
+            if i:
+                random.Random(seed + i).shuffle(paragraphs)
+            text = "\n\n".join(paragraphs)
+            with open(os.path.join(target_dir, f"{stem}_{i:04d}.txt"), "w", encoding="utf-8") as f:
+                f.write(text)
+            total += len(text.encode("utf-8"))
+    return total
+
+
+def run_one(config):
+    """One ingest run (called in a fresh subprocess). Returns a result row."""
+    import chromadb
+    from modules.ingest_engine import run_ingest
+
+    with tempfile.TemporaryDirectory(prefix="bench_ingest_db_") as workdir:
+        client = chromadb.PersistentClient(path=os.path.join(workdir, "chroma"))
+        collection = client.get_or_create_collection("bench_ingest")
+        stats = run_ingest(
+            collection, embedding_factory(config["embedder"]),
+            data_folder=config["corpus"], manifest_path=os.path.join(workdir, "manifest.json"),
+            workers=config["workers"], batch_size=config["batch_size"], writers=config["writers"],
+            progress_every=0, build_bm25=False, docstore_path=None
+        )
+
+    # ru_maxrss is KiB on Linux; children = the largest embedding process
+    # (with one worker there is no pool, only short-lived helper forks)
+    peak_self = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    peak_child = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024 if config["workers"] > 1 else 0.0
+    mb = stats.bytes_read / 1e6
+    return {
+        "embedder": config["embedder"],
+        "batch_size": config["batch_size"],
+        "workers": config["workers"],
+        "writers": config["writers"],
+        "files": stats.files,
+        "chunks": stats.chunks,
+        "mb": round(mb, 3),
+        "startup_s": round(stats.startup, 3),
+        "wall_s": round(stats.elapsed, 3),
+        **{f"{stage}_s": round(v, 3) for stage, v in stats.stages.items()},
+        "chunks_per_sec": round(stats.chunks_per_sec, 1),
+        "mb_per_sec": round(mb / stats.elapsed, 3) if stats.elapsed else 0.0,
+        "peak_rss_mb": round(peak_self, 1),
+        "peak_worker_rss_mb": round(peak_child, 1),
+    }
+
+
+def run_in_subprocess(config):
+    with tempfile.NamedTemporaryFile("r", suffix=".json") as out:
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-one", json.dumps(config), "--result-file", out.name],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        return json.load(out)
+
+
+def write_results(rows, out):
+    with open(f"{out}.json", "w", encoding="utf-8") as f:
+        json.dump(rows, f, indent=2)
+    with open(f"{out}.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ingest pipeline")
+    parser.add_argument("--scale", type=int, default=10, help="copies of data/ in the synthetic corpus")
+    parser.add_argument("--batch-sizes", default="64,256,1024", help="comma-separated")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated embedding process counts")
+    parser.add_argument("--writers", type=int, default=INGEST_WRITERS)
+    parser.add_argument("--embedder", choices=["model", "hash"], default="model")
+    parser.add_argument("--out", default="bench_ingest", help="writes <out>.json and <out>.csv")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        with open(args.result_file, "w", encoding="utf-8") as f:
+            json.dump(run_one(json.loads(args.run_one)), f)
+        return
+
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+    worker_counts = [int(w) for w in args.workers.split(",")]
+
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="bench_ingest_corpus_") as corpus:
+        t0 = time.perf_counter()
+        total = build_corpus(corpus, args.scale)
+        print(f"📂 Synthetic corpus: {len(os.listdir(corpus))} files, {total / 1e6:.1f} MB "
+              f"({args.scale}x data/, built in {time.perf_counter() - t0:.1f}s)")
+
+        for workers in worker_counts:
+            for batch_size in batch_sizes:
+                row = run_in_subprocess({
+                    "corpus": corpus, "embedder": args.embedder,
+                    "batch_size": batch_size, "workers": workers, "writers": args.writers,
+                })
+                rows.append(row)
+                print(
+                    f"⏱️ workers={workers} batch={batch_size:<5} {row['chunks_per_sec']:8.1f} chunks/s "
+                    f"{row['mb_per_sec']:6.2f} MB/s | startup {row['startup_s']:.2f}s load {row['load_s']:.2f}s split {row['split_s']:.2f}s "
+                    f"embed {row['embed_s']:.2f}s write {row['write_s']:.2f}s | "
+                    f"peak {row['peak_rss_mb']:.0f} MB (+{row['peak_worker_rss_mb']:.0f} MB/worker)"
+                )
+
+    best = max(rows, key=lambda r: r["chunks_per_sec"])
+    if best["chunks_per_sec"]:
+        est = best["chunks"] / args.scale * TARGET_SCALE / best["chunks_per_sec"]
+        print(f"🏁 Best: workers={best['workers']} batch={best['batch_size']} -> "
+              f"{TARGET_SCALE}x data/ in ~{est / 60:.1f} min on this machine")
+
+    write_results(rows, args.out)
+    print(f"💾 Wrote {args.out}.json and {args.out}.csv")
+
+
+if __name__ == "__main__":
+    main()
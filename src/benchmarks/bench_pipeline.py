@@ -0,0 +1,232 @@
+"""
+Benchmark perform_rag end to end without an API key.
+
+Runs every technique combination from TECHNIQUE_INFO and every
+PIPELINE_PRESETS entry against the local Chroma store, with a deterministic
+stand-in LLM of configurable latency. Reports per-stage p50/p95/p99, LLM
+calls, tokens and retrieval pool size per configuration.
+
+    python src/benchmarks/bench_pipeline.py --llm-latency 0.05
+    python src/benchmarks/bench_pipeline.py --combos presets --out bench_pipeline.json
+    python src/benchmarks/bench_pipeline.py --baseline bench_pipeline.json   # exit 1 on regressions
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+# Fix path to allow importing modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+from modules.config import (
+    COLLECTION_NAME, TECHNIQUE_INFO, PIPELINE_PRESETS, RERANKER_BACKENDS, COMPRESSION_BACKENDS, DEFAULT_COMPRESSOR
+)
+from modules.database import load_vector_db
+from modules.rag_pipeline import perform_rag
+from modules.tracing import record_stages
+from benchmarks.bench_rerank import SAMPLE_QUERIES, percentile
+
+
+def _digest(text):
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+class FakeLLM(BaseChatModel):
+    """
+    Deterministic stand-in for ChatGroq. Answers each pipeline prompt with a
+    plausible, repeatable reply after `latency` seconds (± `jitter`, also
+    derived from the prompt, so runs are reproducible).
+    """
+
+    latency: float = 0.05
+    jitter: float = 0.2
+    _calls: int = PrivateAttr(default=0)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self):
+        return "fake-benchmark"
+
+    @property
+    def calls(self):
+        return self._calls
+
+    def reset(self):
+        with self._lock:
+            self._calls = 0
+
+    def _reply(self, prompt):
+        if prompt.startswith("Break the question"):
+            q = prompt.split("Question:", 1)[-1].strip()
+            return json.dumps([
+                {"id": 1, "question": f"Who is involved in: {q}", "depends_on": []},
+                {"id": 2, "question": f"Where does it happen: {q}", "depends_on": []},
+                {"id": 3, "question": f"How do they connect: {q}", "depends_on": [1, 2]},
+            ])
+        if prompt.startswith("Answer briefly using ONLY the context"):
+            return "It is mentioned in the retrieved passages."
+        batch = re.search(r"Output ONLY (\d+) numbers", prompt)
+        if batch:
+            return ", ".join(str(_digest(f"{i}{prompt}") % 11) for i in range(int(batch.group(1))))
+        if "Rate relevance" in prompt:
+            return str(_digest(prompt) % 11)
+        if "alternative search queries" in prompt:
+            q = prompt.split("for:", 1)[-1].split(". Sep by newline")[0].strip()
+            return f"{q} history\n{q} explained"
+        if prompt.startswith("Rewrite this query"):
+            return prompt.split("Query:", 1)[-1].strip() + " Harry Potter"
+        if prompt.startswith("Write a hypothetical answer"):
+            return "It is described in the Harry Potter books as an important part of the wizarding world."
+        if prompt.startswith("Extract only sentences"):
+            return prompt.split("from text:", 1)[-1].strip()[:200]
+        return "Based on the context, the answer is described in the retrieved passages."
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        with self._lock:
+            self._calls += 1
+        prompt = messages[-1].content
+        spread = (_digest(prompt) % 1000 / 1000 - 0.5) * 2 * self.jitter
+        time.sleep(max(0.0, self.latency * (1 + spread)))
+
+        reply = self._reply(prompt)
+        usage = {"input_tokens": len(prompt) // 4, "output_tokens": len(reply) // 4,
+                 "total_tokens": len(prompt) // 4 + len(reply) // 4}
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply, usage_metadata=usage))])
+
+
+def technique_combinations():
+    techs = list(TECHNIQUE_INFO)
+    for n in range(len(techs) + 1):
+        for combo in itertools.combinations(techs, n):
+            yield " + ".join(combo) or "(none)", list(combo)
+
+
+def summarize(values):
+    return {
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+    }
+
+
+def run_config(techs, vector_db, llm, queries, repeats, reranker, compressor=DEFAULT_COMPRESSOR):
+    totals, stage_times, calls, pools, tokens, costs = [], {}, [], [], [], []
+    for q in queries:
+        for _ in range(repeats):
+            llm.reset()
+            with record_stages() as timings:
+                t0 = time.perf_counter()
+                result = perform_rag(q, vector_db, llm, techs, reranker=reranker, compressor=compressor)
+                totals.append(time.perf_counter() - t0)
+            tokens.append(result[3])
+            costs.append(result[4])
+            for name, seconds in timings.seconds.items():
+                stage_times.setdefault(name, []).append(seconds)
+            calls.append(llm.calls)
+            pools.append(timings.counts.get("retrieval_pool", 0))
+
+    return {
+        "techniques": techs,
+        "runs": len(totals),
+        "total": summarize(totals),
+        "stages": {name: summarize(v) for name, v in stage_times.items()},
+        "llm_calls": round(sum(calls) / len(calls), 2),
+        "pool_size": round(sum(pools) / len(pools), 2),
+        "tokens": round(sum(tokens) / len(tokens), 1),
+        "cost_usd": sum(costs) / len(costs),
+        "_stage_samples": stage_times,
+    }
+
+
+def compare_to_baseline(results, baseline_path, threshold):
+    """Print configs whose p50 total got slower than baseline by more than `threshold`."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["configs"]
+    regressions = []
+    for name, res in results.items():
+        old = baseline.get(name)
+        if old and old["total"]["p50"] > 0:
+            change = res["total"]["p50"] / old["total"]["p50"] - 1
+            if change > threshold:
+                regressions.append((name, old["total"]["p50"], res["total"]["p50"], change))
+    for name, old, new, change in regressions:
+        print(f"🔺 {name}: p50 {old * 1000:.0f} ms -> {new * 1000:.0f} ms (+{change:.0%})")
+    if not regressions:
+        print(f"✅ No p50 regressions above {threshold:.0%} vs {baseline_path}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark perform_rag with a fake LLM")
+    parser.add_argument("--combos", choices=["all", "presets"], default="all",
+                        help="all = every technique combination + presets")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake LLM call")
+    parser.add_argument("--jitter", type=float, default=0.2, help="± fraction of latency")
+    parser.add_argument("--repeats", type=int, default=1, help="runs per query")
+    parser.add_argument("--queries", type=int, default=len(SAMPLE_QUERIES), help="how many sample queries")
+    parser.add_argument("--reranker", choices=RERANKER_BACKENDS, default="LLM")
+    parser.add_argument("--compressor", choices=COMPRESSION_BACKENDS, default=DEFAULT_COMPRESSOR)
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--baseline", help="earlier --out file to compare p50 totals against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="regression threshold for --baseline")
+    args = parser.parse_args()
+
+    vector_db = load_vector_db(COLLECTION_NAME)
+    llm = FakeLLM(latency=args.llm_latency, jitter=args.jitter)
+    queries = SAMPLE_QUERIES[:args.queries]
+
+    configs = [(f"preset: {name}", p["techs"]) for name, p in PIPELINE_PRESETS.items()]
+    if args.combos == "all":
+        configs += list(technique_combinations())
+    print(f"📂 {len(configs)} configurations x {len(queries)} queries x {args.repeats} repeats "
+          f"(fake LLM {args.llm_latency * 1000:.0f} ms ± {args.jitter:.0%})")
+
+    # Warm up: embedding model, corpus snapshot and BM25 index load once
+    perform_rag(queries[0], vector_db, llm, ["Hybrid Search"], reranker=args.reranker)
+
+    results = {}
+    for name, techs in configs:
+        res = run_config(techs, vector_db, llm, queries, args.repeats, args.reranker, args.compressor)
+        results[name] = res
+        print(
+            f"⏱️ {name:<60.60} p50={res['total']['p50'] * 1000:7.0f} ms  p95={res['total']['p95'] * 1000:7.0f} ms  "
+            f"p99={res['total']['p99'] * 1000:7.0f} ms  llm={res['llm_calls']:4.1f}  pool={res['pool_size']:4.1f}  "
+            f"tokens={res['tokens']:6.0f}"
+        )
+
+    # Per-stage distribution over every configuration that ran the stage
+    all_stages = {}
+    for res in results.values():
+        for stage_name, samples in res.pop("_stage_samples").items():
+            all_stages.setdefault(stage_name, []).extend(samples)
+    print("\n📊 Per stage (all configurations):")
+    for stage_name, samples in sorted(all_stages.items(), key=lambda kv: -percentile(kv[1], 50)):
+        s = summarize(samples)
+        print(f"   {stage_name:<20} p50={s['p50'] * 1000:7.1f} ms  p95={s['p95'] * 1000:7.1f} ms  "
+              f"p99={s['p99'] * 1000:7.1f} ms  (n={len(samples)})")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({
+                "settings": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+                "stages": {name: summarize(v) for name, v in all_stages.items()},
+                "configs": results,
+            }, f, indent=2)
+        print(f"💾 Wrote {args.out}")
+
+    if args.baseline and compare_to_baseline(results, args.baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark rerank backends on the local Chroma store.
+
+Compares the local Cross-Encoder with the LLM scorer: latency per rerank
+call (p50/p95) and how often both agree on the top-N.
+
+    python src/benchmarks/bench_rerank.py --k 10 --repeats 5
+    GROQ_API_KEY=gsk_... python src/benchmarks/bench_rerank.py   # adds the LLM scorer
+"""
+import argparse
+import os
+import sys
+import time
+
+# Fix path to allow importing modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.config import COLLECTION_NAME, RERANK_TOP_N
+from modules.database import load_vector_db
+from modules.llm import get_llm
+from modules.reranker import LLMReranker, CrossEncoderReranker
+
+SAMPLE_QUERIES = [
+    "Who is Harry Potter's enemy?",
+    "What is the core of the Elder Wand?",
+    "Which potion lets you change your appearance?",
+    "Who founded Hogwarts?",
+    "What does Expecto Patronum do?",
+    "How are Hagrid and Harry related?",
+]
+
+
+def percentile(values, p):
+    """Nearest-rank percentile (values need not be sorted)."""
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[idx]
+
+
+def run_backend(reranker, candidates, repeats, top_n):
+    """Time reranker.score over every candidate set; return (timings, top ids per query)."""
+    timings = []
+    tops = {}
+    for q, docs in candidates:
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            scores = reranker.score(q, docs)
+            timings.append(time.perf_counter() - t0)
+        ranked = sorted(zip(docs, scores), key=lambda x: x[1], reverse=True)[:top_n]
+        tops[q] = {d.id for d, _ in ranked}
+    return timings, tops
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rerank backends")
+    parser.add_argument("--k", type=int, default=10, help="candidates per query")
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per query")
+    parser.add_argument("--top-n", type=int, default=RERANK_TOP_N)
+    args = parser.parse_args()
+
+    vector_db = load_vector_db(COLLECTION_NAME)
+    candidates = [(q, vector_db.similarity_search(q, k=args.k)) for q in SAMPLE_QUERIES]
+    print(f"📂 {len(candidates)} queries x {args.k} candidates")
+
+    backends = [CrossEncoderReranker()]
+    llm = get_llm(os.environ.get("GROQ_API_KEY"), cache=False)  # time the scorer, not cache hits
+    if llm:
+        # LLM calls are rate limited, so one timed run per query is enough
+        backends.append(LLMReranker(llm))
+    else:
+        print("ℹ️ GROQ_API_KEY not set, skipping the LLM scorer.")
+
+    # Warm up (model load / connection setup is not part of the rerank cost)
+    for r in backends:
+        r.score(candidates[0][0], candidates[0][1][:1])
+
+    results = {}
+    for r in backends:
+        repeats = args.repeats if isinstance(r, CrossEncoderReranker) else 1
+        timings, tops = run_backend(r, candidates, repeats, args.top_n)
+        results[r.name] = tops
+        print(
+            f"⏱️ {r.name:<14} p50={percentile(timings, 50) * 1000:8.1f} ms  "
+            f"p95={percentile(timings, 95) * 1000:8.1f} ms  "
+            f"mean={sum(timings) / len(timings) * 1000:8.1f} ms  (n={len(timings)})"
+        )
+
+    if len(results) == 2:
+        a, b = results.values()
+        overlap = [len(a[q] & b[q]) / max(1, len(a[q])) for q in a]
+        print(f"🤝 Top-{args.top_n} agreement (Cross-Encoder vs LLM): {sum(overlap) / len(overlap):.0%}")
+
+
+if __name__ == "__main__":
+    main()
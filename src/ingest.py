@@ -1,50 +1,51 @@
 import os
 import sys
-import uuid
+import argparse
+from functools import partial
 
 # Fix path to allow importing modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
 
-from modules.config import DATA_FOLDER, DB_PATH, COLLECTION_NAME, EMBEDDING_MODEL
+from modules.config import (
+    DATA_FOLDER, DB_PATH, COLLECTION_NAME, EMBEDDING_MODEL,
+    INGEST_WORKERS, INGEST_BATCH_SIZE, INGEST_WRITERS
+)
+from modules.ingest_engine import run_ingest
+from modules.cost import fetch_tokenizer
 
-def main():
+
+def main(workers=INGEST_WORKERS, batch_size=INGEST_BATCH_SIZE, writers=INGEST_WRITERS):
     print("🚀 Starting Ingestion...")
-    
+
     if not os.path.exists(DATA_FOLDER):
         print(f"❌ Error: {DATA_FOLDER} not found.")
         return
 
-    # Load
-    loader = DirectoryLoader(DATA_FOLDER, glob="*.txt", loader_cls=TextLoader)
-    documents = loader.load()
-    print(f"📂 Loaded {len(documents)} files.")
-
-    # Chunk
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    chunks = text_splitter.split_documents(documents)
-    
-    # Metadata for Parent-Doc
-    for chunk in chunks:
-        chunk.metadata['source_doc'] = os.path.basename(chunk.metadata.get('source', ''))
-        chunk.metadata['chunk_id'] = str(uuid.uuid4())  
-
-    print(f"✂️ Created {len(chunks)} chunks.")
-
-    # Save
-    embedding_function = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-    vector_db = Chroma(persist_directory=DB_PATH, embedding_function=embedding_function, collection_name=COLLECTION_NAME)
-    
-    # Batch add
-    batch_size = 100
-    for i in range(0, len(chunks), batch_size):
-        vector_db.add_documents(chunks[i:i + batch_size])
-        
+    # Embeddings are computed by the engine's workers, Chroma only stores them
+    vector_db = Chroma(persist_directory=DB_PATH, collection_name=COLLECTION_NAME)
+    stats = run_ingest(
+        vector_db._collection, partial(HuggingFaceEmbeddings, model_name=EMBEDDING_MODEL),
+        workers=workers, batch_size=batch_size, writers=writers
+    )
+
+    print(f"📂 {stats.files} files: {stats.changed} new/changed, {stats.removed} removed, "
+          f"{stats.files - stats.changed} unchanged.")
+    print(f"✂️ Embedded {stats.chunks} new chunks, relabelled {stats.relabelled}, deleted {stats.deleted} stale chunks.")
+    print(f"⚡ {stats.chunks_per_sec:.1f} chunks/sec over {stats.elapsed:.1f}s "
+          f"({workers} embedding worker{'s' if workers != 1 else ''}, batch {batch_size}; "
+          f"{stats.startup:.1f}s worker startup not counted).")
+    # Token counting reads this file locally at query time
+    if fetch_tokenizer():
+        print("🔤 Tokenizer ready.")
     print("✅ Ingestion Complete!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Ingest data/ into the vector store")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="embedding processes")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="chunks per embedding batch")
+    parser.add_argument("--writers", type=int, default=INGEST_WRITERS, help="Chroma upsert threads")
+    args = parser.parse_args()
+    main(workers=args.workers, batch_size=args.batch_size, writers=args.writers)
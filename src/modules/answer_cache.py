@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .config import (
+    ANSWER_CACHE_PATH, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL,
+    ANSWER_CACHE_MIN_SIMILARITY
+)
+
+# perform_rag puts this at the front of log_steps on a hit
+CACHE_LOG_PREFIX = "⚡ Answer Cache"
+
+
+def is_cache_hit(log_steps):
+    return bool(log_steps) and log_steps[0].startswith(CACHE_LOG_PREFIX)
+
+
+def normalize_query(query):
+    """Case/whitespace-insensitive form used for exact matches."""
+    return " ".join(query.lower().split()).strip(" ?!.")
+
+
+class CacheHit:
+    def __init__(self, kind, similarity, payload):
+        self.kind = kind              # "exact" or "semantic"
+        self.similarity = similarity
+        self.answer = payload["answer"]
+        self.docs = [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in payload["docs"]]
+        self.log_steps = payload["logs"]
+
+
+class AnswerCache:
+    """
+    Disk-backed (SQLite) cache of final answers.
+
+    Entries are scoped by `variant` (technique set, reranker, collection
+    version). Lookup is by normalized query text first, then by cosine
+    similarity of the query embedding. Old entries expire after `ttl`
+    seconds and the least recently used are evicted past `max_entries`.
+    """
+
+    def __init__(self, path=ANSWER_CACHE_PATH, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 ttl=ANSWER_CACHE_TTL, min_similarity=ANSWER_CACHE_MIN_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.min_similarity = min_similarity
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " key TEXT PRIMARY KEY, variant TEXT NOT NULL, embedding BLOB,"
+            " payload TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_variant ON answers (variant)")
+        self._conn.commit()
+
+    @staticmethod
+    def _key(query, variant):
+        return hashlib.sha256(f"{variant}\0{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+    def _touch(self, key):
+        self._conn.execute("UPDATE answers SET accessed = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+
+    def get(self, query, variant):
+        """Exact (normalized) match, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM answers WHERE key = ? AND created >= ?",
+                (self._key(query, variant), time.time() - self.ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            self._touch(self._key(query, variant))
+        return CacheHit("exact", 1.0, json.loads(row[0]))
+
+    def get_similar(self, embedding, variant):
+        """Closest cached query by cosine similarity, if above the threshold."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, embedding, payload FROM answers"
+                " WHERE variant = ? AND embedding IS NOT NULL AND created >= ?",
+                (variant, time.time() - self.ttl)
+            ).fetchall()
+        if not rows:
+            return None
+
+        matrix = np.stack([np.frombuffer(r[1], dtype=np.float32) for r in rows])
+        q = np.asarray(embedding, dtype=np.float32)
+        sims = matrix @ q / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(q) + 1e-12)
+        best = int(np.argmax(sims))
+        if sims[best] < self.min_similarity:
+            return None
+
+        with self._lock:
+            self._touch(rows[best][0])
+        return CacheHit("semantic", float(sims[best]), json.loads(rows[best][2]))
+
+    def put(self, query, variant, embedding, answer, docs, log_steps):
+        payload = json.dumps({
+            "answer": answer,
+            "docs": [{"page_content": d.page_content, "metadata": d.metadata} for d in docs],
+            "logs": log_steps,
+        }, default=str)
+        blob = None if embedding is None else np.asarray(embedding, dtype=np.float32).tobytes()
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, variant, embedding, payload, created, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (self._key(query, variant), variant, blob, payload, now, now)
+            )
+            # TTL, then LRU
+            self._conn.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM answers WHERE key IN ("
+                " SELECT key FROM answers ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
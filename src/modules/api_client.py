@@ -0,0 +1,58 @@
+import time
+
+import httpx
+from langchain_core.documents import Document
+
+from .config import API_TIMEOUT, DEFAULT_RERANKER, DEFAULT_COMPRESSOR
+from .tracing import Trace
+
+
+def _docs(items):
+    return [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in items]
+
+
+def _result(r):
+    """Service result -> the (answer, docs, lat, tokens, cost, log_steps) tuple perform_rag returns."""
+    return r["answer"], _docs(r["docs"]), r["lat"], r["tokens"], r["cost"], r["logs"]
+
+
+class ApiClient:
+    """
+    Thin client for src/server.py; results come back in the same shapes
+    as the local pipeline functions, so app.py renders either one.
+    """
+
+    def __init__(self, base_url, api_key, timeout=API_TIMEOUT):
+        self._http = httpx.Client(
+            base_url=base_url, timeout=timeout, headers={"X-Groq-Api-Key": api_key}
+        )
+
+    def _post(self, path, body):
+        response = self._http.post(path, json=body)
+        if response.is_error:
+            try:
+                message = response.json().get("error")
+            except ValueError:
+                message = response.text
+            raise RuntimeError(f"{path} failed ({response.status_code}): {message}")
+        return response.json()
+
+    def stream_query(self, query, techniques, reranker=DEFAULT_RERANKER, compressor=DEFAULT_COMPRESSOR):
+        """
+        stream_rag-shaped events from one /query call: the logs, the whole
+        answer as a single token, then ("done", dict). `ttft` is the round trip.
+        """
+        t0 = time.time()
+        r = self._post("/query", {"query": query, "techniques": techniques,
+                                  "reranker": reranker, "compressor": compressor})
+        for line in r["logs"]:
+            yield ("log", line)
+        yield ("token", r["answer"])
+        yield ("done", {**r, "docs": _docs(r["docs"]), "ttft": time.time() - t0,
+                        "trace": Trace.from_otel(r["trace"])})
+
+    def compare_pipelines(self, query, techs_a, techs_b, reranker_a=DEFAULT_RERANKER, reranker_b=DEFAULT_RERANKER):
+        """Same result as rag_pipeline.compare_pipelines, computed by the service."""
+        r = self._post("/ab", {"query": query, "techs_a": techs_a, "techs_b": techs_b,
+                               "reranker_a": reranker_a, "reranker_b": reranker_b})
+        return _result(r["a"]), _result(r["b"]), r["shared"]
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import pickle
+
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+from .config import PROCESSED_DIR
+
+
+def tokenize(text):
+    """Whitespace tokenizer (same as LangChain's BM25Retriever default)."""
+    return text.split()
+
+
+def collection_fingerprint(ids):
+    """
+    Order-independent hash of every chunk id in a collection.
+    Changes whenever chunks are added or removed.
+    """
+    h = hashlib.sha1()
+    for chunk_id in sorted(ids):
+        h.update(chunk_id.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def bm25_index_path(collection_name):
+    """BM25 index lives next to chroma_db, one file per collection."""
+    return os.path.join(PROCESSED_DIR, f"{collection_name}_bm25.pkl")
+
+
+class BM25Index:
+    """
+    Prebuilt BM25 statistics over every chunk of a collection.
+    Stores chunk ids only; callers map ids back to documents.
+    """
+
+    def __init__(self, ids, texts, fingerprint):
+        self.ids = list(ids)
+        self.fingerprint = fingerprint
+        # BM25Okapi divides by corpus size, so an empty collection has no model
+        self.bm25 = BM25Okapi([tokenize(t or "") for t in texts]) if self.ids else None
+
+    @classmethod
+    def from_pages(cls, pages):
+        """
+        Build from an iterable of (ids, texts) pages, tokenizing page by page
+        so the raw text of the whole collection is never held at once.
+        """
+        ids = []
+
+        def tokens():
+            for page_ids, page_texts in pages:
+                ids.extend(page_ids)
+                for text in page_texts:
+                    yield tokenize(text or "")
+
+        index = cls([], [], None)
+        try:
+            index.bm25 = BM25Okapi(tokens())
+        except ZeroDivisionError:
+            index.bm25 = None  # empty collection
+        index.ids = ids
+        index.fingerprint = collection_fingerprint(ids)
+        return index
+
+    def search(self, query, k):
+        """Return the top-k (chunk_id, score) pairs, best first."""
+        if self.bm25 is None or k <= 0:
+            return []
+        scores = self.bm25.get_scores(tokenize(query))
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+
+def build_bm25_index(ids, texts):
+    return BM25Index(ids, texts, collection_fingerprint(ids))
+
+
+def save_bm25_index(index, collection_name):
+    """Write atomically so readers never see a half-written pickle."""
+    path = bm25_index_path(collection_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def read_bm25_index(collection_name):
+    """Load the index from disk, or None if missing/unreadable."""
+    path = bm25_index_path(collection_name)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except Exception:
+        return None
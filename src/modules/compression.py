@@ -0,0 +1,126 @@
+import re
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+
+from .concurrency import run_concurrently, arun_concurrently, in_pool
+from .config import (
+    COMPRESS_MIN_CHARS, COMPRESS_LLM_MAX_CHARS, COMPRESS_MAX_CONCURRENCY, COMPRESS_TIMEOUT,
+    COMPRESS_TOP_SENTENCES, COMPRESS_MIN_SIMILARITY
+)
+
+EXTRACT_PROMPT = ChatPromptTemplate.from_template(
+    "Extract only sentences answering '{q}' from text: {t}"
+)
+
+# Sentences, and the "Key: value" lines the lore files are full of
+_SENTENCE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def split_sentences(text):
+    return [s.strip() for s in _SENTENCE.split(text) if s.strip()]
+
+
+def _compressed(doc, text):
+    return Document(page_content=text, metadata={**doc.metadata, "compressed": True}, id=doc.id)
+
+
+class Compressor:
+    """Base class: subclasses implement compress(query, docs) -> docs."""
+
+    name = "base"
+
+    def compress(self, query, docs):
+        raise NotImplementedError
+
+    async def acompress(self, query, docs):
+        """Async compress(); by default the sync one runs on the shared pool."""
+        return await in_pool(self.compress, query, docs)
+
+
+class LLMCompressor(Compressor):
+    """
+    Asks the chat LLM to extract the sentences that answer the query.
+    One call per long document, all in flight at once (bounded by
+    `max_concurrency`); a failed or timed-out call keeps the original text.
+    """
+
+    name = "LLM"
+
+    def __init__(self, llm, max_concurrency=COMPRESS_MAX_CONCURRENCY, timeout=COMPRESS_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.chain = EXTRACT_PROMPT | llm | StrOutputParser()
+
+    def _extract(self, query, doc):
+        return self.chain.invoke({"q": query, "t": doc.page_content[:COMPRESS_LLM_MAX_CHARS]})
+
+    async def _aextract(self, query, doc):
+        return await self.chain.ainvoke({"q": query, "t": doc.page_content[:COMPRESS_LLM_MAX_CHARS]})
+
+    @staticmethod
+    def _replace(docs, long_docs, extracted):
+        by_doc = {id(d): text for d, text in zip(long_docs, extracted) if text}
+        return [_compressed(d, by_doc[id(d)]) if id(d) in by_doc else d for d in docs]
+
+    def compress(self, query, docs):
+        long_docs = [d for d in docs if len(d.page_content) > COMPRESS_MIN_CHARS]
+        extracted = run_concurrently(
+            lambda d: self._extract(query, d), long_docs, self.max_concurrency, self.timeout
+        )
+        return self._replace(docs, long_docs, extracted)
+
+    async def acompress(self, query, docs):
+        long_docs = [d for d in docs if len(d.page_content) > COMPRESS_MIN_CHARS]
+        extracted = await arun_concurrently(
+            lambda d: self._aextract(query, d), long_docs, self.max_concurrency, self.timeout
+        )
+        return self._replace(docs, long_docs, extracted)
+
+
+class ExtractiveCompressor(Compressor):
+    """
+    Local, no LLM: keeps each long document's sentences closest to the query.
+    The query and every sentence of every document go through one
+    embed_documents call; scoring is a single matrix-vector product.
+    """
+
+    name = "Extractive"
+
+    def __init__(self, embeddings, top_n=COMPRESS_TOP_SENTENCES, min_similarity=COMPRESS_MIN_SIMILARITY):
+        self.embeddings = embeddings
+        self.top_n = top_n
+        self.min_similarity = min_similarity
+
+    def compress(self, query, docs):
+        split = [split_sentences(d.page_content) if len(d.page_content) > COMPRESS_MIN_CHARS else None
+                 for d in docs]
+        sentences = [s for parts in split if parts for s in parts]
+        if not sentences:
+            return list(docs)
+
+        vectors = np.asarray(self.embeddings.embed_documents([query] + sentences), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        sims = vectors[1:] @ vectors[0]
+
+        out, pos = [], 0
+        for d, parts in zip(docs, split):
+            if not parts:
+                out.append(d)
+                continue
+            doc_sims = sims[pos:pos + len(parts)]
+            pos += len(parts)
+            # Best sentences above the floor (always at least the best one), in reading order
+            best = np.argsort(-doc_sims)[:self.top_n]
+            keep = sorted(i for i in best if doc_sims[i] >= self.min_similarity) or [int(best[0])]
+            out.append(_compressed(d, " ".join(parts[i] for i in keep)))
+        return out
+
+
+def get_compressor(backend, llm, embeddings):
+    """Build the compressor for a pipeline's chosen backend."""
+    if backend == LLMCompressor.name:
+        return LLMCompressor(llm)
+    return ExtractiveCompressor(embeddings)
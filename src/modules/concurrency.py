@@ -0,0 +1,158 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import lru_cache, wraps
+
+from .config import EXECUTOR_MAX_WORKERS
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Process-wide thread pool for I/O-bound work (LLM calls, DB lookups).
+    Created on first use and shared by every session.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=EXECUTOR_MAX_WORKERS, thread_name_prefix="ragscope"
+                )
+    return _executor
+
+
+def shared_resource(maxsize=1):
+    """
+    Process-wide cache for a resource loader (models, DB handles, indexes),
+    usable from the app, the server and scripts alike. Calls to one loader
+    are serialised, so concurrent first calls share a single load.
+    """
+    def decorate(fn):
+        cached = lru_cache(maxsize=maxsize)(fn)
+        lock = threading.Lock()
+
+        @wraps(fn)
+        def load(*args):
+            with lock:
+                return cached(*args)
+
+        load.cache_clear = cached.cache_clear
+        return load
+
+    return decorate
+
+
+def submit(fn, *args, **kwargs):
+    """
+    Submit to the shared pool, carrying over the caller's context variables
+    (active trace span, LangChain callbacks) into the worker thread.
+    """
+    return get_executor().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+async def in_pool(fn, *args, **kwargs):
+    """Await fn(*args, **kwargs) on the shared pool, keeping context variables like submit()."""
+    return await asyncio.wrap_future(submit(fn, *args, **kwargs))
+
+
+def run_sync(coro):
+    """
+    Run a coroutine to completion from synchronous code. If this thread
+    already runs an event loop, the coroutine gets its own loop on the pool.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    return submit(asyncio.run, coro).result()
+
+
+def iter_async(agen):
+    """
+    Iterate an async generator from synchronous code, on a private event
+    loop in this thread. Must not be called from inside a running loop.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                item = loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        loop.run_until_complete(agen.aclose())
+        loop.run_until_complete(loop.shutdown_default_executor())
+        loop.close()
+
+
+async def arun_concurrently(afn, items, max_concurrency=8, timeout=None, default=None):
+    """
+    Async counterpart of run_concurrently: await afn(item) for every item,
+    at most `max_concurrency` at once. Results are in input order; a call
+    that raises or takes longer than `timeout` seconds yields `default`.
+    """
+    gate = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def one(item):
+        async with gate:
+            try:
+                return await asyncio.wait_for(afn(item), timeout)
+            except Exception:
+                return default
+
+    return list(await asyncio.gather(*(one(item) for item in items)))
+
+
+def run_concurrently(fn, items, max_concurrency=8, timeout=None, default=None):
+    """
+    Run fn(item) for every item on the shared pool, keeping at most
+    `max_concurrency` calls in flight.
+
+    Results come back in input order. A call that raises, or is still
+    running `timeout` seconds after it was submitted, yields `default`.
+    """
+    items = list(items)
+    results = [default] * len(items)
+    if not items:
+        return results
+
+    queue = iter(enumerate(items))
+    in_flight = {}  # future -> (index, deadline)
+
+    def submit_next():
+        for i, item in queue:
+            deadline = time.monotonic() + timeout if timeout else None
+            in_flight[submit(fn, item)] = (i, deadline)
+            return
+
+    for _ in range(max(1, max_concurrency)):
+        submit_next()
+
+    while in_flight:
+        deadlines = [d for _, d in in_flight.values() if d is not None]
+        wait_for = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+        done, _ = wait(in_flight, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+        now = time.monotonic()
+        for future in list(in_flight):
+            i, deadline = in_flight[future]
+            if future in done:
+                try:
+                    results[i] = future.result()
+                except Exception:
+                    pass
+            elif deadline is not None and now >= deadline:
+                # Abandon it: the slot is freed, the late result is ignored
+                future.cancel()
+            else:
+                continue
+            del in_flight[future]
+            submit_next()
+
+    return results
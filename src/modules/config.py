@@ -5,10 +5,60 @@ BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
 
 # Paths
 DATA_FOLDER = os.path.join(BASE_DIR, "data")
-DB_PATH = os.path.join(BASE_DIR, "processed_data", "chroma_db")
+PROCESSED_DIR = os.path.join(BASE_DIR, "processed_data")
+DB_PATH = os.path.join(PROCESSED_DIR, "chroma_db")
+MANIFEST_PATH = os.path.join(PROCESSED_DIR, "ingest_manifest.json")
+DOCSTORE_PATH = os.path.join(PROCESSED_DIR, "docstore.bin")   # full texts, read through mmap
 
 COLLECTION_NAME = "harry_potter_lore"
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+LLM_MODEL = "llama-3.3-70b-versatile"
+
+# USD per 1M tokens (prompt, completion), Groq on-demand list prices.
+# Models not listed are billed at LLM_MODEL's rate.
+MODEL_PRICING = {
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "llama-3.1-8b-instant": (0.05, 0.08),
+    "llama3-70b-8192": (0.59, 0.79),
+    "llama3-8b-8192": (0.05, 0.08),
+    "gemma2-9b-it": (0.20, 0.20),
+}
+
+# Local token counts (packing budgets, calls without provider usage).
+# Llama 3's tokenizer extends cl100k_base's BPE ranks (100k -> 128k tokens), so
+# cl100k counts are a close proxy. The rank file is fetched once (ingest / app or
+# server startup) into processed_data; queries only ever read it from disk.
+TOKENIZER_ENCODING = "cl100k_base"
+TOKENIZER_URL = "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken"
+TOKENIZER_SHA256 = "223921b76ee99bde995b7ff738513eef100fb51d18c93597a113bcffe865b2a7"
+TOKENIZER_PATH = os.path.join(PROCESSED_DIR, "cl100k_base.tiktoken")
+TOKENIZER_FETCH_TIMEOUT = 10  # seconds
+
+# Chunking
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+# Parent-Document (parents are rebuilt from neighbouring chunks; legacy chunks without positions are found in their file)
+PARENT_MODES = ["window", "section"]
+PARENT_MODE = "window"   # window = hit ± PARENT_WINDOW chunks, section = the hit's whole heading section
+PARENT_WINDOW = 2
+
+# Context packing (token budget of the generation prompt)
+MODEL_CONTEXT_WINDOWS = {
+    "llama-3.3-70b-versatile": 131072,
+    "llama-3.1-8b-instant": 131072,
+    "llama3-70b-8192": 8192,
+    "llama3-8b-8192": 8192,
+    "gemma2-9b-it": 8192,
+}
+ANSWER_TOKEN_RESERVE = 1024   # left free for the answer
+CONTEXT_TOKEN_BUDGET = 6000   # cap on context tokens even with a bigger window (latency/cost)
+MIN_TRIM_TOKENS = 64          # don't squeeze a doc into a smaller leftover than this
+
+# Ingestion (streaming: reader -> embedding workers -> Chroma writers)
+INGEST_BATCH_SIZE = 256                                    # chunks per embed_documents call
+INGEST_WORKERS = max(1, min(4, (os.cpu_count() or 1) // 2))  # embedding processes (1 = in-process)
+INGEST_WRITERS = 2                                         # threads upserting into Chroma
 
 # Technique Metadata (Clean Text)
 TECHNIQUE_INFO = {
@@ -21,12 +71,12 @@ TECHNIQUE_INFO = {
     "Reranking": {
         "desc": "Re-scores retrieved documents using an AI model.",
         "pros": "High precision, filters irrelevant chunks.",
-        "cons": "Higher latency due to LLM usage.",
+        "cons": "Higher latency with LLM scoring (Cross-Encoder runs locally).",
         "pair_with": "Hybrid, Multi-Query"
     },
     "Parent-Document": {
-        "desc": "Fetches full original document context.",
-        "pros": "Zero missing context.",
+        "desc": "Expands each hit to its surrounding chunks or section.",
+        "pros": "Keeps the context around a precise match.",
         "cons": "Higher token usage.",
         "pair_with": "Context Compression"
     },
@@ -39,7 +89,7 @@ TECHNIQUE_INFO = {
     "Sub-Query": {
         "desc": "Breaks complex problems into steps.",
         "pros": "Solves multi-hop logic problems.",
-        "cons": "Slowest technique (Sequential).",
+        "cons": "1 planning call + 1 per sub-question (max 4); only dependent steps wait.",
         "pair_with": "Reranking"
     },
     "HyDE": {
@@ -51,7 +101,7 @@ TECHNIQUE_INFO = {
     "Context Compression": {
         "desc": "Extracts only relevant sentences.",
         "pros": "Reduces noise and tokens.",
-        "cons": "Requires extra LLM processing.",
+        "cons": "LLM mode adds a call per document (extractive mode runs locally).",
         "pair_with": "Parent-Document"
     },
     "Query Rewriting": {
@@ -68,4 +118,64 @@ PIPELINE_PRESETS = {
     "Deep Research": {"techs": ["Hybrid Search", "Reranking", "Parent-Document", "Multi-Query"]},
     "Fast Retrieval": {"techs": ["Hybrid Search", "Context Compression"]},
     "Logic/Reasoning": {"techs": ["Sub-Query", "Reranking"]}
-}
\ No newline at end of file
+}
+
+# Answer cache (exact match, then nearest query embedding)
+ANSWER_CACHE_PATH = os.path.join(PROCESSED_DIR, "answer_cache.sqlite3")
+ANSWER_CACHE_MAX_ENTRIES = 1000
+ANSWER_CACHE_TTL = 24 * 3600         # seconds
+ANSWER_CACHE_MIN_SIMILARITY = 0.95   # cosine similarity for a semantic hit
+
+# LLM sub-step cache (rewrite, HyDE, multi-query, rerank, compression...)
+LLM_CACHE_MAX_ITEMS = 2048                                       # in-memory LRU tier
+LLM_CACHE_PATH = os.path.join(PROCESSED_DIR, "llm_cache.sqlite3")  # None = memory only
+LLM_CACHE_MAX_ENTRIES = 20000                                    # SQLite tier, least recently used evicted
+LLM_CACHE_TTL = 7 * 24 * 3600                                    # seconds
+
+# Concurrency (shared thread pool for I/O-bound fan-out)
+EXECUTOR_MAX_WORKERS = 32
+
+# Fusion (Reciprocal Rank Fusion across retrievers and query variants)
+RRF_K = 60
+RRF_WEIGHTS = {"vector": 1.0, "bm25": 1.0}
+
+# Reranking
+RERANKER_BACKENDS = ["LLM", "Cross-Encoder"]
+DEFAULT_RERANKER = "LLM"
+CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_TOP_N = 5
+RERANK_MAX_CONCURRENCY = 8   # LLM scoring calls in flight at once
+RERANK_TIMEOUT = 20.0        # seconds per scoring call, then default score
+RERANK_BATCH_SIZE = 1        # >1 scores that many docs in a single prompt
+
+# Context Compression
+COMPRESSION_BACKENDS = ["Extractive", "LLM"]
+DEFAULT_COMPRESSOR = "Extractive"
+COMPRESS_MIN_CHARS = 500          # shorter docs are kept as they are
+COMPRESS_LLM_MAX_CHARS = 1500     # text sent per LLM extraction call
+COMPRESS_MAX_CONCURRENCY = 8      # LLM extraction calls in flight at once
+COMPRESS_TIMEOUT = 20.0           # seconds per LLM call, then the doc is kept whole
+COMPRESS_TOP_SENTENCES = 4        # extractive: sentences kept per doc
+COMPRESS_MIN_SIMILARITY = 0.2     # extractive: cosine floor (the best sentence is always kept)
+
+# Sub-Query (decomposition into a dependency graph of sub-questions)
+SUBQUERY_MAX_QUESTIONS = 4     # caps the LLM cost: 1 plan call + 1 answer call each
+SUBQUERY_MAX_CONCURRENCY = 4   # sub-questions solved at once
+SUBQUERY_TIMEOUT = 20.0        # seconds per sub-question, then it counts as "unknown"
+SUBQUERY_K = 3                 # chunks retrieved per sub-question
+
+# Query service (src/server.py)
+SERVER_PORT = 8000
+SERVER_MAX_CONCURRENCY = 16   # pipelines running at once per worker process; the rest queue
+SERVER_MAX_BATCH = 32         # questions per /query batch request
+SERVER_INGEST_TOKEN = os.environ.get("RAGSCOPE_INGEST_TOKEN")  # POST /ingest needs it in X-Ingest-Token; unset = disabled
+API_TIMEOUT = 120.0           # seconds the Streamlit thin client waits for the service
+API_URL = os.environ.get("RAGSCOPE_API_URL")  # set = app.py sends queries to the service instead of running them
+
+# Pipeline plans (technique set compiled once into stages + prebuilt chains)
+PLAN_CACHE_SIZE = 64   # cached plans (technique set x backends x LLM)
+
+# Query embeddings (coalesced across concurrent callers, see embedding_batcher.py)
+EMBED_BATCH_WINDOW = 0.003   # seconds to wait for more texts before one batched encode
+EMBED_MAX_BATCH = 128        # texts per encode; bigger calls (ingest) bypass the batcher
+EMBED_CACHE_SIZE = 4096      # recent query vectors kept (LRU, float32: ~1.5 KB each at 384 dims)
@@ -0,0 +1,94 @@
+import re
+
+from langchain_core.documents import Document
+
+from .config import (
+    LLM_MODEL, MODEL_CONTEXT_WINDOWS, ANSWER_TOKEN_RESERVE, CONTEXT_TOKEN_BUDGET, MIN_TRIM_TOKENS
+)
+from .cost import count_tokens
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+_WORD = re.compile(r"[a-z0-9']+")
+GAP = " … "
+
+
+def context_budget(prompt_overhead=0, model=LLM_MODEL):
+    """
+    Tokens available for retrieved context: the model's window minus the
+    answer reserve and the rest of the prompt, capped at CONTEXT_TOKEN_BUDGET.
+    """
+    window = MODEL_CONTEXT_WINDOWS.get(model, MODEL_CONTEXT_WINDOWS[LLM_MODEL])
+    return max(0, min(CONTEXT_TOKEN_BUDGET, window - ANSWER_TOKEN_RESERVE - prompt_overhead))
+
+
+def _header_tokens(doc):
+    # format_docs() prefix and separator
+    return count_tokens(f"[Source: {doc.metadata.get('source_doc', 'Unknown')}] ") + 2
+
+
+def _terms(text):
+    return {w for w in _WORD.findall(text.lower()) if len(w) > 2}
+
+
+def trim_to_budget(text, query, budget):
+    """
+    Best sentences of `text` for `query` (by term overlap) that fit in
+    `budget` tokens, kept in their original order. Skipped stretches are
+    marked with an ellipsis. Returns (text, tokens), or ("", 0) if nothing fits.
+    """
+    sentences = [s.strip() for s in _SENTENCE.split(text) if s.strip()]
+    q_terms = _terms(query)
+    scored = sorted(
+        range(len(sentences)),
+        key=lambda i: (-len(q_terms & _terms(sentences[i])), i)  # ties: earlier first
+    )
+
+    gap_cost = count_tokens(GAP)
+    chosen, used = set(), 0
+    for i in scored:
+        cost = count_tokens(sentences[i]) + gap_cost
+        if used + cost <= budget:
+            chosen.add(i)
+            used += cost
+
+    if not chosen:
+        return "", 0
+    parts, prev = [], None
+    for i in sorted(chosen):
+        if prev is not None and i != prev + 1:
+            parts.append(GAP.strip())
+        parts.append(sentences[i])
+        prev = i
+    packed = " ".join(parts)
+    return packed, count_tokens(packed)
+
+
+def pack_context(docs, query, budget):
+    """
+    Fit ranked `docs` into `budget` tokens (as format_docs renders them).
+
+    Docs are taken best-first; one that does not fit whole is trimmed to
+    its most query-relevant sentences, as long as at least MIN_TRIM_TOKENS
+    are left. Later (smaller) docs can still fill the remainder.
+    Returns (packed docs, tokens used, number trimmed, number dropped).
+    """
+    packed, used, trimmed, dropped = [], 0, 0, 0
+
+    for d in docs:
+        left = budget - used - _header_tokens(d)
+        tokens = count_tokens(d.page_content)
+        if tokens <= left:
+            packed.append(d)
+            used += tokens + _header_tokens(d)
+            continue
+
+        if left >= MIN_TRIM_TOKENS:
+            text, tokens = trim_to_budget(d.page_content, query, left)
+            if text:
+                packed.append(Document(page_content=text, metadata={**d.metadata, "trimmed": True}, id=d.id))
+                used += tokens + _header_tokens(d)
+                trimmed += 1
+                continue
+        dropped += 1
+
+    return packed, used, trimmed, dropped
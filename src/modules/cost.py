@@ -0,0 +1,131 @@
+import hashlib
+import os
+import threading
+import urllib.request
+
+from .config import (
+    LLM_MODEL, MODEL_PRICING, TOKENIZER_ENCODING, TOKENIZER_URL, TOKENIZER_SHA256, TOKENIZER_PATH,
+    TOKENIZER_FETCH_TIMEOUT
+)
+
+# cl100k_base split pattern (tiktoken_ext.openai_public), so the ranks can be loaded from a local file
+_CL100K_PATTERN = r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s"""
+
+_encoding = None
+_loaded = False
+_load_lock = threading.Lock()
+
+
+def fetch_tokenizer(path=TOKENIZER_PATH, timeout=TOKENIZER_FETCH_TIMEOUT):
+    """Download the BPE rank file once (checked against TOKENIZER_SHA256); True if it is on disk."""
+    if os.path.exists(path):
+        return True
+    try:
+        with urllib.request.urlopen(TOKENIZER_URL, timeout=timeout) as response:
+            data = response.read()
+    except OSError as e:
+        print(f"⚠️ Tokenizer download failed ({e}); token counts will be estimates.")
+        return False
+    if hashlib.sha256(data).hexdigest() != TOKENIZER_SHA256:
+        print("⚠️ Tokenizer download did not match its checksum; token counts will be estimates.")
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+def load_tokenizer(download=False, path=TOKENIZER_PATH):
+    """
+    Load the tokenizer from `path` (fetching it first if download=True).
+    Call once at startup; returns False if counts fall back to estimates.
+    """
+    global _encoding, _loaded
+    with _load_lock:
+        if _encoding is None:
+            if download:
+                fetch_tokenizer(path)
+            try:
+                import tiktoken
+                from tiktoken.load import load_tiktoken_bpe
+                if os.path.exists(path):
+                    _encoding = tiktoken.Encoding(
+                        TOKENIZER_ENCODING, pat_str=_CL100K_PATTERN,
+                        mergeable_ranks=load_tiktoken_bpe(path, expected_hash=TOKENIZER_SHA256),
+                        special_tokens={"<|endoftext|>": 100257},
+                    )
+            except Exception:
+                _encoding = None  # tiktoken not installed, or a damaged rank file
+        _loaded = True
+    return _encoding is not None
+
+
+def _get_encoding():
+    if not _loaded:
+        load_tokenizer()  # local file only: the query path never touches the network
+    return _encoding
+
+
+def tokens_estimated():
+    """True while count_tokens falls back to a character estimate (no tokenizer file)."""
+    return _get_encoding() is None
+
+
+def count_tokens(text):
+    """Local token count for calls the provider did not report usage for."""
+    if not text:
+        return 0
+    enc = _get_encoding()
+    if enc is None:
+        return len(text) // 3 + 1  # errs high, so packed context still fits the budget
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def price(model, prompt_tokens, completion_tokens):
+    """USD for one call; unknown models are billed like LLM_MODEL."""
+    p_in, p_out = MODEL_PRICING.get(model, MODEL_PRICING[LLM_MODEL])
+    return (prompt_tokens * p_in + completion_tokens * p_out) / 1_000_000
+
+
+def generation_usage(generation, prompt_text):
+    """
+    (prompt tokens, completion tokens, source) for one LLM generation.
+    source is "provider" (usage_metadata), "estimate" (local tokenizer)
+    or "cache" (answered by the LLM cache, free).
+    """
+    message = getattr(generation, "message", None)
+    if message is not None and message.response_metadata.get("cache_hit"):
+        return 0, 0, "cache"
+
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0), "provider"
+    return count_tokens(prompt_text), count_tokens(generation.text), "estimate"
+
+
+def cost_breakdown(spans):
+    """
+    Per-stage rows (first-seen order) over trace spans that made LLM calls:
+    stage, calls, cached, prompt_tokens, completion_tokens, cost.
+    """
+    rows = {}
+    for s in spans:
+        if not s.llm_calls:
+            continue
+        row = rows.setdefault(s.name, {
+            "stage": s.name, "calls": 0, "cached": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0,
+        })
+        row["calls"] += s.llm_calls
+        row["cached"] += s.cache_hits
+        row["prompt_tokens"] += s.tokens_in
+        row["completion_tokens"] += s.tokens_out
+        row["cost"] += s.cost
+    return list(rows.values())
+
+
+def total_usage(spans):
+    """(total tokens, USD) over spans."""
+    return sum(s.tokens_in + s.tokens_out for s in spans), sum(s.cost for s in spans)
@@ -1,28 +1,50 @@
 import os
-import streamlit as st
+from langchain_core.documents import Document
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
-from .config import DB_PATH, EMBEDDING_MODEL, DATA_FOLDER
+from .config import DB_PATH, EMBEDDING_MODEL, DATA_FOLDER, CROSS_ENCODER_MODEL, DOCSTORE_PATH
+from .bm25_index import (
+    bm25_index_path, build_bm25_index, collection_fingerprint,
+    read_bm25_index, save_bm25_index
+)
+from .docstore import open_docstore
+from .embedding_batcher import CoalescingEmbeddings
+from .concurrency import shared_resource
 
 
 # -----------------------------
 # EMBEDDING (cached)
 # -----------------------------
-@st.cache_resource
+@shared_resource()
 def get_embedding():
     """
-    Load embedding model only once.
-    Prevents Streamlit from reloading the model every refresh.
+    Load embedding model only once per process
+    (not on every Streamlit rerun or server request).
+    Concurrent embed calls are coalesced into batches and recent
+    vectors are cached (see CoalescingEmbeddings).
     """
-    return HuggingFaceEmbeddings(
+    return CoalescingEmbeddings(HuggingFaceEmbeddings(
         model_name=EMBEDDING_MODEL
-    )
+    ))
+
+
+# -----------------------------
+# CROSS-ENCODER (cached)
+# -----------------------------
+@shared_resource()
+def get_cross_encoder():
+    """
+    Load the local reranking model only once (CPU, no API calls).
+    Imported lazily so the LLM-only path never pays for it.
+    """
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(CROSS_ENCODER_MODEL, device="cpu")
 
 
 # -----------------------------
 # VECTOR DATABASE
 # -----------------------------
-@st.cache_resource
+@shared_resource(maxsize=8)
 def load_vector_db(collection_name: str):
     """
     Load Chroma vector database with caching.
@@ -43,13 +65,188 @@ def load_vector_db(collection_name: str):
     )
 
 
+# -----------------------------
+# CORPUS SNAPSHOT (cached)
+# -----------------------------
+class CorpusSnapshot:
+    """
+    Every chunk of a collection (ids, texts, metadata) at one version.
+    Shared read-only across sessions; document() hands out fresh copies.
+    """
+
+    def __init__(self, ids, texts, metadatas):
+        self.ids = list(ids)
+        self.texts = list(texts)
+        self.metadatas = list(metadatas)
+        self.fingerprint = collection_fingerprint(self.ids)
+        self._pos = {chunk_id: i for i, chunk_id in enumerate(self.ids)}
+        # Adjacency: (source_doc, chunk_index) -> position (chunks ingested with a layout)
+        self._order = {
+            (m.get("source_doc"), m["chunk_index"]): i
+            for i, m in enumerate(self.metadatas)
+            if m and m.get("chunk_index") is not None
+        }
+
+    def __len__(self):
+        return len(self.ids)
+
+    def document(self, chunk_id):
+        """Build a new Document for a chunk id (None if unknown)."""
+        i = self._pos.get(chunk_id)
+        if i is None:
+            return None
+        return Document(
+            id=chunk_id,
+            page_content=self.texts[i],
+            metadata=dict(self.metadatas[i] or {})
+        )
+
+    def _section(self, source_doc, chunk_index):
+        i = self._order.get((source_doc, chunk_index))
+        return None if i is None else self.metadatas[i].get("section")
+
+    def parent_range(self, chunk_id, mode="window", window=2):
+        """
+        (source_doc, first, last) chunk indexes of a chunk's parent:
+        ±`window` neighbours, or every chunk of its section.
+        None if the chunk has no position metadata (older ingest).
+        """
+        i = self._pos.get(chunk_id)
+        meta = self.metadatas[i] if i is not None else None
+        if not meta or meta.get("chunk_index") is None:
+            return None
+        src, n = meta.get("source_doc"), meta["chunk_index"]
+
+        if mode == "section":
+            section = meta.get("section")
+            first = last = n
+            while self._section(src, first - 1) == section:
+                first -= 1
+            while self._section(src, last + 1) == section:
+                last += 1
+            return src, first, last
+
+        first, last = max(0, n - window), n + window
+        while (src, last) not in self._order:
+            last -= 1
+        return src, first, last
+
+    def char_span(self, source_doc, first, last):
+        """[start, end) characters covered by chunks first..last, or None without offsets."""
+        rows = [self.metadatas[i] for i in
+                (self._order.get((source_doc, n)) for n in range(first, last + 1)) if i is not None]
+        if not rows or any(m.get("start", -1) < 0 for m in rows):
+            return None
+        return rows[0]["start"], max(m["end"] for m in rows)
+
+    def stitch(self, source_doc, first, last):
+        """
+        Text of chunks first..last of a file, overlaps removed using
+        the stored character offsets (no file read).
+        """
+        parts, end = [], -1
+        for n in range(first, last + 1):
+            i = self._order.get((source_doc, n))
+            if i is None:
+                continue
+            text, meta = self.texts[i], self.metadatas[i]
+            start = meta.get("start", -1)
+            if parts and start >= 0 and end >= 0:
+                if start < end:
+                    text = text[end - start:]  # drop the CHUNK_OVERLAP already included
+                else:
+                    parts.append("\n\n" if start - end > 1 else "\n")
+            elif parts:
+                parts.append("\n")
+            parts.append(text)
+            end = max(end, meta.get("end", -1))
+        return "".join(parts)
+
+
+def collection_version(vector_db):
+    """
+    Cheap change marker for a collection: chunk count + sqlite mtime.
+    Avoids touching chunk contents just to check for staleness.
+    """
+    sqlite_path = os.path.join(DB_PATH, "chroma.sqlite3")
+    mtime = os.path.getmtime(sqlite_path) if os.path.exists(sqlite_path) else 0.0
+    return (vector_db._collection.count(), mtime)
+
+
+@shared_resource(maxsize=4)
+def load_corpus_snapshot(vector_db, collection_name: str, version):
+    """
+    Pull the whole collection once per version.
+    Keyed on (vector_db, collection_name, version) so all sessions share one copy.
+    """
+    data = vector_db.get(include=["documents", "metadatas"])
+    return CorpusSnapshot(data["ids"], data["documents"], data["metadatas"])
+
+
+def get_corpus_snapshot(vector_db):
+    """Snapshot of the collection behind the (cached) vector_db resource."""
+    return load_corpus_snapshot(
+        vector_db, vector_db._collection.name, collection_version(vector_db)
+    )
+
+
+# -----------------------------
+# BM25 INDEX (cached)
+# -----------------------------
+@shared_resource(maxsize=4)
+def load_bm25_index(collection_name: str, version: float):
+    """
+    Load the prebuilt BM25 index once per file version.
+    `version` is the index file mtime, so a rebuilt index is picked up.
+    """
+    return read_bm25_index(collection_name)
+
+
+def get_bm25_index(collection_name: str, snapshot: CorpusSnapshot):
+    """
+    Return the BM25 index for a collection.
+    Rebuilds (and re-saves) it if it is missing or the collection changed.
+    """
+    path = bm25_index_path(collection_name)
+    version = os.path.getmtime(path) if os.path.exists(path) else 0.0
+    index = load_bm25_index(collection_name, version)
+
+    if index is None or index.fingerprint != snapshot.fingerprint:
+        index = build_bm25_index(snapshot.ids, snapshot.texts)
+        save_bm25_index(index, collection_name)
+
+    return index
+
+
+# -----------------------------
+# DOCSTORE (mmap, cached)
+# -----------------------------
+@shared_resource(maxsize=2)
+def load_docstore(version: float):
+    """
+    Map the docstore once per file version (its mtime).
+    The mapping is shared by every session; the OS shares the pages across processes.
+    """
+    return open_docstore(DOCSTORE_PATH)
+
+
+def get_docstore():
+    """The current docstore, or None before the first ingest."""
+    version = os.path.getmtime(DOCSTORE_PATH) if os.path.exists(DOCSTORE_PATH) else 0.0
+    return load_docstore(version)
+
+
 # -----------------------------
 # FILE READING
 # -----------------------------
 def get_full_file_content(filename: str):
     """
-    Read full text file from disk.
+    Full text of a data file: from the docstore, or from disk
+    for files it does not have yet.
     """
+    store = get_docstore()
+    if store is not None and filename in store:
+        return store.text(filename)
 
     os.makedirs(DATA_FOLDER, exist_ok=True)
 
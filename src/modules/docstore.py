@@ -0,0 +1,96 @@
+import json
+import mmap
+import os
+import struct
+
+from .config import DOCSTORE_PATH
+
+# File layout: [utf-8 text of every file][json index][u64 index offset]
+# One file, so a rebuild is a single atomic replace and readers that still
+# have the old version mapped keep a consistent view.
+_FOOTER = struct.Struct("<Q")
+MARK_STRIDE = 1024  # chars between char -> byte checkpoints (non-ASCII files only)
+
+
+def _char_marks(text):
+    marks, pos = [], 0
+    for k in range(0, len(text), MARK_STRIDE):
+        marks.append(pos)
+        pos += len(text[k:k + MARK_STRIDE].encode("utf-8"))
+    return marks
+
+
+def build_docstore(files, data_folder, path=DOCSTORE_PATH):
+    """
+    Concatenate `files` (names in data_folder) into one docstore file.
+    Reads one file at a time. Returns the number of bytes of text stored.
+    """
+    index, offset = {}, 0
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as out:
+        for fname in files:
+            with open(os.path.join(data_folder, fname), "r", encoding="utf-8") as f:
+                text = f.read()
+            data = text.encode("utf-8")
+            out.write(data)
+            index[fname] = {
+                "offset": offset, "length": len(data), "chars": len(text),
+                "marks": None if len(data) == len(text) else _char_marks(text),
+            }
+            offset += len(data)
+        out.write(json.dumps(index, separators=(",", ":")).encode("utf-8"))
+        out.write(_FOOTER.pack(offset))
+    os.replace(tmp_path, path)
+    return offset
+
+
+class DocStore:
+    """
+    Read-only view of a docstore file through mmap. Pages live in the OS
+    page cache, so every session and process shares one copy.
+    Offsets are in characters, like the chunk `start`/`end` metadata.
+    """
+
+    def __init__(self, path=DOCSTORE_PATH):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (index_at,) = _FOOTER.unpack_from(self._mm, len(self._mm) - _FOOTER.size)
+        self.index = json.loads(self._mm[index_at:len(self._mm) - _FOOTER.size])
+
+    def __contains__(self, fname):
+        return fname in self.index
+
+    def files(self):
+        return list(self.index)
+
+    def raw(self, fname):
+        """Zero-copy memoryview of a file's utf-8 bytes."""
+        e = self.index[fname]
+        return memoryview(self._mm)[e["offset"]:e["offset"] + e["length"]]
+
+    def text(self, fname):
+        return str(self.raw(fname), "utf-8")
+
+    def slice(self, fname, start, end):
+        """Characters [start, end) of a file, decoding only the bytes around them."""
+        e = self.index[fname]
+        start, end = max(0, start), min(end, e["chars"])
+        if start >= end:
+            return ""
+        base, marks = e["offset"], e["marks"]
+        if marks is None:  # ASCII: chars are bytes
+            return str(self._mm[base + start:base + end], "ascii")
+
+        first, last = start // MARK_STRIDE, end // MARK_STRIDE + 1
+        byte_from = marks[first]
+        byte_to = marks[last] if last < len(marks) else e["length"]
+        text = str(self._mm[base + byte_from:base + byte_to], "utf-8")
+        skip = first * MARK_STRIDE
+        return text[start - skip:end - skip]
+
+
+def open_docstore(path=DOCSTORE_PATH):
+    """DocStore for `path`, or None if ingest has not built one yet."""
+    if not os.path.exists(path):
+        return None
+    return DocStore(path)
@@ -0,0 +1,131 @@
+import asyncio
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from .concurrency import in_pool
+from .config import EMBED_BATCH_WINDOW, EMBED_MAX_BATCH, EMBED_CACHE_SIZE
+
+
+class CoalescingEmbeddings(Embeddings):
+    """
+    Front-end for an embedding model shared by every session and request.
+
+    Texts from concurrent callers are queued. A single background thread
+    collects whatever arrives within `window` seconds (up to `max_batch`
+    texts) and encodes it in one embed_documents call, then resolves one
+    future per text. A text that is already queued or being encoded shares
+    that future. Recent query embeddings (embed_query / aembed_query) are
+    kept in an LRU as float32 arrays, so repeated queries skip the model;
+    document texts (compressor sentences, ingest) are never cached, so
+    they cannot evict them.
+
+    Queries and documents are encoded alike, which holds for models without
+    a query-specific prompt (like all-MiniLM-L6-v2). Calls with more than
+    `max_batch` texts (ingest) go straight to the model.
+    """
+
+    def __init__(self, model, window=EMBED_BATCH_WINDOW, max_batch=EMBED_MAX_BATCH, cache_size=EMBED_CACHE_SIZE):
+        self.model = model
+        self.window = window
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # query text -> vector (float32 array), oldest first
+        self._pending = {}           # text -> Future, queued or being encoded
+        self._cacheable = set()      # pending texts that were asked for as queries
+        self._lock = threading.Lock()
+        self._queue = queue.SimpleQueue()
+        self._worker = None
+        self.counts = {"texts": 0, "cache_hits": 0, "shared": 0, "encoded": 0, "batches": 0}
+
+    def submit(self, texts, cache=False):
+        """
+        One Future per text, resolving to its vector (a float32 array).
+        cache=True (queries) looks texts up in, and adds them to, the LRU.
+        """
+        futures = []
+        with self._lock:
+            self._start()
+            for text in texts:
+                self.counts["texts"] += 1
+                vector = self._cache.get(text) if cache else None
+                if vector is not None:
+                    self._cache.move_to_end(text)
+                    self.counts["cache_hits"] += 1
+                    future = Future()
+                    future.set_result(vector)
+                elif text in self._pending:
+                    self.counts["shared"] += 1
+                    future = self._pending[text]
+                else:
+                    future = self._pending[text] = Future()
+                    self._queue.put(text)
+                if cache and vector is None:
+                    self._cacheable.add(text)
+                futures.append(future)
+        return futures
+
+    def _start(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self._encode(batch)
+
+    def _encode(self, texts):
+        try:
+            vectors = [np.asarray(v, dtype=np.float32) for v in self.model.embed_documents(texts)]
+        except Exception as e:
+            with self._lock:
+                futures = [self._pending.pop(t) for t in texts]
+                self._cacheable.difference_update(texts)
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        with self._lock:
+            self.counts["encoded"] += len(texts)
+            self.counts["batches"] += 1
+            futures = []
+            for text, vector in zip(texts, vectors):
+                if text in self._cacheable:
+                    self._cacheable.discard(text)
+                    self._cache[text] = vector
+                futures.append(self._pending.pop(text))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        for future, vector in zip(futures, vectors):
+            future.set_result(vector)
+
+    # --- Embeddings interface ---
+
+    def embed_documents(self, texts):
+        if len(texts) > self.max_batch:
+            return self.model.embed_documents(texts)
+        return [f.result().tolist() for f in self.submit(texts)]
+
+    def embed_query(self, text):
+        return self.submit([text], cache=True)[0].result().tolist()
+
+    async def aembed_documents(self, texts):
+        if len(texts) > self.max_batch:
+            return await in_pool(self.model.embed_documents, texts)
+        vectors = await asyncio.gather(*(asyncio.wrap_future(f) for f in self.submit(texts)))
+        return [v.tolist() for v in vectors]
+
+    async def aembed_query(self, text):
+        return (await asyncio.wrap_future(self.submit([text], cache=True)[0])).tolist()
@@ -0,0 +1,54 @@
+from .config import RRF_K, RRF_WEIGHTS
+
+
+def chunk_key(doc):
+    """Identity of a chunk: Chroma id, then chunk_id metadata, then the text itself."""
+    return doc.id or doc.metadata.get("chunk_id") or doc.page_content
+
+
+def reciprocal_rank_fusion(ranked_lists, k=RRF_K, weights=None, top_n=None):
+    """
+    Fuse several ranked result lists with weighted Reciprocal Rank Fusion.
+
+    `ranked_lists` is an iterable of (retriever_name, [(doc, score), ...]),
+    each list best-first. A chunk gets sum(weight / (k + rank)) over every
+    list it appears in. Duplicates are matched on chunk id and on identical
+    text (a DB can hold the same chunk under several ids); within one list
+    a duplicate only counts at its best rank.
+
+    The best raw score per retriever is kept as `<name>_score` metadata and
+    the fused score as `rrf_score`. Ties keep first-seen order.
+    """
+    weights = RRF_WEIGHTS if weights is None else weights
+    by_key, by_text = {}, {}  # chunk key / page_content -> [doc, rrf score]
+    entries = []              # unique entries, first-seen order
+
+    for name, results in ranked_lists:
+        w = weights.get(name, 1.0)
+        field = f"{name}_score"
+        counted = set()
+        for rank, (doc, score) in enumerate(results, start=1):
+            key = chunk_key(doc)
+            entry = by_key.get(key) or by_text.get(doc.page_content)
+            if entry is None:
+                entry = [doc, 0.0]
+                entries.append(entry)
+            by_key.setdefault(key, entry)
+            by_text.setdefault(doc.page_content, entry)
+
+            if id(entry) not in counted:
+                counted.add(id(entry))
+                entry[1] += w / (k + rank)
+            best = entry[0].metadata.get(field)
+            if score is not None and (best is None or score > best):
+                entry[0].metadata[field] = score
+
+    ranked = sorted(entries, key=lambda e: e[1], reverse=True)
+    if top_n is not None:
+        ranked = ranked[:top_n]
+
+    docs = []
+    for doc, rrf in ranked:
+        doc.metadata["rrf_score"] = rrf
+        docs.append(doc)
+    return docs
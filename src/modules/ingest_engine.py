@@ -0,0 +1,405 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import time
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+from langchain_community.document_loaders import TextLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from .config import (
+    DATA_FOLDER, MANIFEST_PATH, DOCSTORE_PATH, CHUNK_SIZE, CHUNK_OVERLAP,
+    INGEST_BATCH_SIZE, INGEST_WORKERS, INGEST_WRITERS
+)
+from .bm25_index import BM25Index, save_bm25_index, read_bm25_index
+from .docstore import build_docstore
+
+# Bump when chunk metadata gains fields: older manifest entries are re-split
+# and their chunks relabelled (same ids, so nothing is re-embedded)
+CHUNK_LAYOUT = 2
+
+# "=== THE GOLDEN TRIO ===", "## Spells", or a short title line opening a paragraph
+_SECTION = re.compile(r"(?:^|\n\n)(={2,}[^\n]*?={2,}|#{1,6} [^\n]+|[^\n.:]{3,60}:?)(?=\n)")
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def assign_chunk_ids(source_doc, chunks):
+    """
+    Deterministic chunk ids: hash of (file, content, occurrence).
+    Unchanged text keeps its id across runs, so re-ingesting is idempotent.
+    """
+    seen = {}
+    ids = []
+    for chunk in chunks:
+        n = seen.get(chunk.page_content, 0)
+        seen[chunk.page_content] = n + 1
+        chunk_id = hashlib.sha256(f"{source_doc}\0{n}\0{chunk.page_content}".encode("utf-8")).hexdigest()
+
+        chunk.metadata['source_doc'] = source_doc
+        chunk.metadata['chunk_id'] = chunk_id
+        ids.append(chunk_id)
+    return ids
+
+
+def find_headings(text):
+    """(offset, title) of every section heading in a file, in order."""
+    return [(m.start(1), m.group(1).strip("=# :\t")) for m in _SECTION.finditer(text)]
+
+
+def section_span(text, start, end):
+    """[start, end) of the heading section(s) covering characters [start, end)."""
+    heading_starts = [h[0] for h in find_headings(text)]
+    h = bisect_right(heading_starts, start) - 1
+    n = bisect_right(heading_starts, max(start, end - 1))
+    return (heading_starts[h] if h >= 0 else 0), (heading_starts[n] if n < len(heading_starts) else len(text))
+
+
+def annotate_chunks(text, chunks):
+    """
+    Record each chunk's place in its file: chunk_index, [start, end) character
+    offsets (from the splitter's start_index, -1 if unknown) and the section
+    heading it starts under. Retrieval rebuilds parents from these.
+    """
+    headings = find_headings(text)
+    heading_starts = [h[0] for h in headings]
+    for n, chunk in enumerate(chunks):
+        start = chunk.metadata.pop("start_index", -1)
+        h = bisect_right(heading_starts, max(start, 0)) - 1
+        chunk.metadata.update(
+            chunk_index=n,
+            start=start,
+            end=start + len(chunk.page_content) if start >= 0 else -1,
+            section=headings[h][1] if h >= 0 else "",
+        )
+
+
+def load_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+class IngestStats:
+    """Counters and per-stage seconds of one ingest run."""
+
+    def __init__(self):
+        self.files = 0
+        self.changed = 0
+        self.removed = 0
+        self.bytes_read = 0
+        self.chunks = 0       # embedded and written
+        self.relabelled = 0   # kept chunks whose metadata was rewritten
+        self.deleted = 0
+        # embed is summed over workers, so it can exceed wall time
+        self.stages = {"load": 0.0, "split": 0.0, "embed": 0.0, "write": 0.0}
+        self.startup = 0.0    # starting the embedding workers and loading their models
+        self.elapsed = 0.0    # wall time without worker startup / shutdown
+
+    @property
+    def chunks_per_sec(self):
+        """Steady-state throughput: worker startup and shutdown are not counted."""
+        return self.chunks / self.elapsed if self.elapsed else 0.0
+
+
+# --- Embedding workers ---
+# Each worker (process, or the single in-process thread) builds its own
+# embedding model once and keeps it for every batch.
+_embedding = None
+_ready = None  # process pool: barrier every worker reaches once warmed up
+
+
+def _init_embedder(factory, torch_threads=None, ready=None):
+    global _embedding, _ready
+    if torch_threads:
+        try:
+            import torch
+            torch.set_num_threads(torch_threads)  # don't oversubscribe cores across processes
+        except ImportError:
+            pass
+    _embedding = factory()
+    _ready = ready
+
+
+def _warm_up():
+    # Blocks at the barrier, so n warm-up tasks land on n different workers
+    _embedding.embed_documents(["warm up"])
+    if _ready is not None:
+        _ready.wait()
+
+
+def _embed_batch(texts):
+    t0 = time.perf_counter()
+    vectors = np.asarray(_embedding.embed_documents(texts), dtype=np.float32)
+    return vectors, time.perf_counter() - t0
+
+
+def make_embed_pool(embedding_factory, workers):
+    """
+    workers > 1: a process pool, one model per process (spawned, so no torch
+    state is forked). workers <= 1: one background thread in this process.
+    `embedding_factory` must be picklable for the process pool.
+    """
+    if workers <= 1:
+        return ThreadPoolExecutor(max_workers=1, initializer=_init_embedder, initargs=(embedding_factory,))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    ctx = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=ctx,
+        initializer=_init_embedder, initargs=(embedding_factory, threads, ctx.Barrier(workers))
+    )
+
+
+def warm_up_pool(pool, workers):
+    """Start every worker and load its model; returns the seconds it took."""
+    t0 = time.perf_counter()
+    for future in [pool.submit(_warm_up) for _ in range(max(1, workers))]:
+        future.result()
+    return time.perf_counter() - t0
+
+
+# --- Producer ---
+
+def iter_pending_chunks(files, data_folder, manifest, new_manifest, stale_ids, stats, skip_ids=frozenset()):
+    """
+    Lazily yield (chunk, chunk_id, embed) for every chunk of a new, changed
+    or older-layout file. embed=False means the vector is already stored
+    and only the metadata needs rewriting.
+
+    Only one file is read and split at a time. As a side effect fills
+    `new_manifest` and `stale_ids` (chunks of changed files that are gone).
+    """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True
+    )
+
+    for fname in files:
+        path = os.path.join(data_folder, fname)
+        stat = os.stat(path)
+        entry = manifest.get(fname)
+        current = entry is not None and entry.get("layout") == CHUNK_LAYOUT
+
+        # Same size + mtime -> skip without even reading the file
+        if current and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            new_manifest[fname] = entry
+            continue
+
+        digest = file_sha256(path)
+        if current and entry["sha256"] == digest:
+            new_manifest[fname] = {**entry, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+            continue
+
+        # New, changed or older layout: re-chunk, then diff chunk ids against the last run
+        stats.changed += 1
+        stats.bytes_read += stat.st_size
+        t0 = time.perf_counter()
+        docs = TextLoader(path, encoding="utf-8").load()
+        t1 = time.perf_counter()
+        chunks = splitter.split_documents(docs)
+        annotate_chunks(docs[0].page_content, chunks)
+        stats.stages["load"] += t1 - t0
+        stats.stages["split"] += time.perf_counter() - t1
+
+        ids = assign_chunk_ids(fname, chunks)
+        old_ids = set(entry["chunk_ids"]) if entry else set()
+        keep = set(ids)
+        stale_ids.extend(i for i in old_ids if i not in keep)
+
+        new_manifest[fname] = {
+            "mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+            "sha256": digest, "chunk_ids": ids, "layout": CHUNK_LAYOUT
+        }
+
+        # Kept chunks still get their new position/section written
+        for chunk, chunk_id in zip(chunks, ids):
+            yield chunk, chunk_id, chunk_id not in old_ids and chunk_id not in skip_ids
+
+
+def iter_batches(pairs, batch_size):
+    batch = []
+    for pair in pairs:
+        batch.append(pair)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_collection_pages(collection, page_size=1000):
+    """(ids, documents) pages over a whole Chroma collection."""
+    offset = 0
+    while True:
+        page = collection.get(include=["documents"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        yield page["ids"], page["documents"]
+        offset += len(page["ids"])
+
+
+# --- Pipeline ---
+
+def run_ingest(collection, embedding_factory, data_folder=DATA_FOLDER, manifest_path=MANIFEST_PATH,
+               workers=INGEST_WORKERS, batch_size=INGEST_BATCH_SIZE, writers=INGEST_WRITERS,
+               progress_every=5.0, build_bm25=True, docstore_path=DOCSTORE_PATH):
+    """
+    Stream every new/changed chunk of `data_folder` into `collection`.
+
+    Files are read and split lazily, embedded in batches on `workers`
+    processes and upserted by `writers` threads. At most ~2 batches per
+    worker and per writer are in flight, so memory stays bounded by the
+    batch size and the largest single file, not by the corpus. Chunks that
+    are already stored only get their metadata updated.
+    `build_bm25=False` leaves the on-disk keyword index alone (benchmarks).
+    The docstore (full texts for parent lookups) is rebuilt when any file
+    changed; `docstore_path=None` skips it.
+    Returns an IngestStats.
+    """
+    started = time.perf_counter()
+    stats = IngestStats()
+
+    # Manifest = what is already in the collection, per file
+    manifest = load_manifest(manifest_path)
+    if manifest and collection.count() == 0:
+        manifest = {}  # DB was wiped, start over
+
+    # No manifest (first run, or a DB from before content-hash ids): reconcile
+    # against what is stored, keeping every chunk we would have produced anyway
+    existing = set(collection.get(include=[])["ids"]) if not manifest else frozenset()
+
+    files = sorted(f for f in os.listdir(data_folder) if f.endswith(".txt"))
+    stats.files = len(files)
+    new_manifest, stale_ids = {}, []
+    pending = iter_pending_chunks(files, data_folder, manifest, new_manifest, stale_ids, stats, skip_ids=existing)
+
+    def upsert(batch, vectors):
+        t0 = time.perf_counter()
+        collection.upsert(
+            ids=[i for _, i in batch],
+            embeddings=vectors,
+            documents=[c.page_content for c, _ in batch],
+            metadatas=[c.metadata for c, _ in batch],
+        )
+        return len(batch), time.perf_counter() - t0
+
+    def update_metadata(batch):
+        t0 = time.perf_counter()
+        collection.update(ids=[i for _, i in batch], metadatas=[c.metadata for c, _ in batch])
+        return 0, time.perf_counter() - t0
+
+    embedding_jobs = deque()  # (batch, future), oldest first
+    write_jobs = set()
+    last_report = [time.perf_counter()]
+
+    def finish_writes(block):
+        if not write_jobs:
+            return
+        done, _ = wait(write_jobs, return_when=FIRST_COMPLETED) if block else (
+            [f for f in write_jobs if f.done()], None)
+        for future in done:
+            write_jobs.discard(future)
+            n, seconds = future.result()
+            stats.chunks += n
+            stats.stages["write"] += seconds
+
+        now = time.perf_counter()
+        if done and progress_every and now - last_report[0] >= progress_every:
+            last_report[0] = now
+            print(f"⏳ {stats.chunks} chunks written ({stats.chunks / (now - started - stats.startup):.0f} chunks/sec)")
+
+    with make_embed_pool(embedding_factory, workers) as embed_pool, \
+            ThreadPoolExecutor(max_workers=writers, thread_name_prefix="ingest-writer") as write_pool:
+
+        def submit_write(fn, *args):
+            while len(write_jobs) >= 2 * writers:
+                finish_writes(block=True)
+            write_jobs.add(write_pool.submit(fn, *args))
+            finish_writes(block=False)
+
+        def hand_off_oldest():
+            batch, future = embedding_jobs.popleft()
+            vectors, seconds = future.result()
+            stats.stages["embed"] += seconds
+            submit_write(upsert, batch, vectors)
+
+        relabel = []
+
+        def flush_relabel():
+            stats.relabelled += len(relabel)
+            submit_write(update_metadata, relabel[:])
+            relabel.clear()
+
+        def to_embed():
+            # Metadata-only updates go straight to the writers, in batches
+            for chunk, chunk_id, embed in pending:
+                if embed:
+                    yield chunk, chunk_id
+                    continue
+                relabel.append((chunk, chunk_id))
+                if len(relabel) >= batch_size:
+                    flush_relabel()
+
+        for batch in iter_batches(to_embed(), batch_size):
+            if not stats.startup:
+                # Workers start on first use; keep their startup out of the throughput
+                stats.startup = warm_up_pool(embed_pool, workers)
+            embedding_jobs.append((batch, embed_pool.submit(_embed_batch, [c.page_content for c, _ in batch])))
+            # Back-pressure: the reader waits once every worker has two batches queued
+            while len(embedding_jobs) >= 2 * max(1, workers):
+                hand_off_oldest()
+
+        while embedding_jobs:
+            hand_off_oldest()
+        if relabel:
+            flush_relabel()
+        while write_jobs:
+            finish_writes(block=True)
+
+        removed = [f for f in manifest if f not in new_manifest]
+        stats.removed = len(removed)
+        for fname in removed:
+            stale_ids.extend(manifest[fname]["chunk_ids"])
+        if existing:
+            wanted = {i for e in new_manifest.values() for i in e["chunk_ids"]}
+            stale_ids = [i for i in existing if i not in wanted]
+
+        # Delete stale chunks, batches in parallel
+        deletes = [write_pool.submit(collection.delete, ids=stale_ids[i:i + batch_size])
+                   for i in range(0, len(stale_ids), batch_size)]
+        for future in deletes:
+            future.result()
+        stats.deleted = len(stale_ids)
+        # Stop before the pool shuts down: like startup, joining the workers is not throughput
+        stats.elapsed = time.perf_counter() - started - stats.startup
+
+    # Keyword index over the whole collection (not just this run's chunks)
+    if build_bm25 and (stats.chunks or stats.deleted or read_bm25_index(collection.name) is None):
+        index = BM25Index.from_pages(iter_collection_pages(collection))
+        save_bm25_index(index, collection.name)
+        print(f"🔑 Built BM25 index over {len(index.ids)} chunks.")
+
+    if docstore_path and (stats.changed or stats.removed or not os.path.exists(docstore_path)):
+        size = build_docstore(files, data_folder, docstore_path)
+        print(f"🗄️ Built docstore: {len(files)} files, {size / 1e6:.2f} MB.")
+
+    save_manifest(new_manifest, manifest_path)
+    return stats
@@ -34,8 +34,11 @@ TEXTS = {
         "analysis": "Analysis",
         "logs": "System Logs",
         "context": "Context",
+        "trace": "Trace",
         "btn_read": "Read File",
         "btn_compare": "Compare Strategies",
+        "reranker": "Reranker Backend",
+        "compressor": "Compression Mode",
         "learn_intro": "Learn RAG concepts from scratch, just like a Computer Science 101 class.",
         # (Lessons คงเดิม...)
         "lessons": { 
@@ -54,8 +57,8 @@ TEXTS = {
             "Parent-Document": {
                 "concept": "Find the Needle, Return the Haystack",
                 "problem": "Basics: 'Chunking' is splitting text into small pieces (e.g., 5 lines) for the DB.\n\nScenario: A chunk says: 'He killed him.'\n- Problem: Who is 'He'? Who is 'him'?\n- Without the previous paragraphs (Context), this information is useless to the AI.",
-                "process": "1. Search using small chunks (precise matching).\n2. When a chunk is found, look at its ID tag (e.g., 'Chapter 1').\n3. Go to the Hard Drive and load the *entire* Chapter 1.\n4. Send the full chapter to the AI so it knows who 'He' is.",
-                "technical": "Tech Stack: Metadata Mapping (Child Chunk ID -> Parent Doc ID) + Disk I/O."
+                "process": "1. Search using small chunks (precise matching).\n2. When a chunk is found, look at its position tag (file, chunk number, section).\n3. Pull its neighbouring chunks (or its whole section) from memory and stitch them back together.\n4. Send that passage to the AI so it knows who 'He' is.",
+                "technical": "Tech Stack: Chunk Adjacency Index (source_doc, chunk_index, offsets) held in memory, no Disk I/O."
             },
             "Multi-Query": {
                 "concept": "Asking the same question in different ways",
@@ -67,7 +70,7 @@ TEXTS = {
                 "concept": "Divide and Conquer (Step-by-Step)",
                 "problem": "Basics: Search Engines are bad at logic.\n\nScenario: 'Who is older, Harry or Ron?'\n- If you search this directly, you might find nothing comparing their ages.\n- You need two separate facts: Harry's birthday AND Ron's birthday.",
                 "process": "1. Break it down: 'Find Harry's birthday' (Step 1).\n2. Search and get answer (e.g., 1980).\n3. Break it down: 'Find Ron's birthday' (Step 2).\n4. Search and get answer (e.g., 1980).\n5. AI compares the two facts.",
-                "technical": "Tech Stack: Chain-of-Thought Decomposition -> Sequential Retrieval Loops."
+                "technical": "Tech Stack: Chain-of-Thought Decomposition -> Dependency Graph (DAG); independent steps are retrieved and answered in parallel."
             },
             "HyDE": {
                 "concept": "Fake it 'til you make it",
@@ -122,8 +125,11 @@ TEXTS = {
         "analysis": "วิเคราะห์ระบบ",
         "logs": "บันทึกการทำงาน",
         "context": "ข้อมูลอ้างอิง",
+        "trace": "ลำดับเวลา (Trace)",
         "btn_read": "อ่านไฟล์",
         "btn_compare": "เริ่มเปรียบเทียบ",
+        "reranker": "ตัวจัดอันดับ (Reranker)",
+        "compressor": "โหมดบีบอัดบริบท (Compression)",
         "learn_intro": "เรียนรู้หลักการทำงานของ RAG เหมือนนั่งเรียนวิชาเขียนโปรแกรมเบื้องต้น",
         # (Lessons คงเดิม...)
         "lessons": {
@@ -142,8 +148,8 @@ TEXTS = {
             "Parent-Document": {
                 "concept": "หาจากชิ้นเล็ก แต่ส่งข้อมูลชิ้นใหญ่",
                 "problem": "พื้นฐาน: การทำ 'Chunking' คือการหั่นหนังสือเป็นย่อหน้าเล็กๆ\n\nสถานการณ์: เจอ Chunk ที่เขียนว่า 'เขาฆ่ามันตาย'\n- ปัญหา: AI ไม่รู้ว่า 'เขา' คือใคร และ 'มัน' คือตัวอะไร เพราะบริบทอยู่ในย่อหน้าก่อนหน้า\n- ถ้าส่งไปแค่นี้ AI จะตอบว่า 'ไม่ทราบชื่อตัวละคร'",
-                "process": "1. ค้นหาด้วย Chunk เล็กๆ (เพื่อให้เจอง่าย)\n2. เมื่อเจอแล้ว ให้ดู 'รหัสอ้างอิง' (Source ID)\n3. วิ่งไปเปิดไฟล์ต้นฉบับ แล้วก๊อปปี้ 'ทั้งบท' มาแทน\n4. ส่งบทเต็มให้ AI อ่าน มันจะรู้ทันทีว่า 'เขา' คือโวลเดอมอร์",
-                "technical": "เชิงเทคนิค: การทำ Metadata Mapping ระหว่าง Child Chunk กับ Parent Document"
+                "process": "1. ค้นหาด้วย Chunk เล็กๆ (เพื่อให้เจอง่าย)\n2. เมื่อเจอแล้ว ให้ดู 'ตำแหน่ง' ของมัน (ไฟล์, ลำดับ Chunk, หัวข้อ)\n3. ดึง Chunk ข้างเคียง (หรือทั้งหัวข้อ) จากหน่วยความจำมาต่อกันเป็นย่อหน้าเต็ม\n4. ส่งย่อหน้านั้นให้ AI อ่าน มันจะรู้ทันทีว่า 'เขา' คือโวลเดอมอร์",
+                "technical": "เชิงเทคนิค: Chunk Adjacency Index (source_doc, chunk_index, offsets) ในหน่วยความจำ ไม่ต้องเปิดไฟล์"
             },
             "Multi-Query": {
                 "concept": "การถามเผื่อ (Query Expansion)",
@@ -155,7 +161,7 @@ TEXTS = {
                 "concept": "การแตกปัญหาใหญ่ (Divide and Conquer)",
                 "problem": "พื้นฐาน: การเปรียบเทียบต้องใช้ข้อมูล 2 ชุด\n\nสถานการณ์: 'แฮร์รี่กับรอน ใครแก่กว่า?'\n- ปัญหา: ไม่มีเอกสารใบไหนเขียนเทียบวันเกิดคู่นี้ไว้ตรงๆ\n- การค้นหาทีเดียวจึงล้มเหลว",
                 "process": "1. แตกงานเป็นข้อย่อย: 'หาวันเกิดแฮร์รี่' (ข้อ 1)\n2. ค้นหาและจำไว้ (1980)\n3. แตกงานต่อ: 'หาวันเกิดรอน' (ข้อ 2)\n4. ค้นหาและจำไว้ (1980)\n5. เอาข้อมูล 2 ชุดมาเทียบกัน",
-                "technical": "เชิงเทคนิค: การทำ Chain-of-Thought เพื่อค้นหาแบบเป็นลำดับขั้น (Step-by-Step)"
+                "technical": "เชิงเทคนิค: แตกคำถามเป็นกราฟความสัมพันธ์ (DAG) ข้อที่ไม่ขึ้นต่อกันค้นหาและตอบพร้อมกัน ข้อที่ต้องใช้คำตอบก่อนหน้าค่อยรอ"
             },
             "HyDE": {
                 "concept": "การมโนคำตอบล่วงหน้า",
@@ -1,7 +1,20 @@
+from langchain_core.globals import get_llm_cache as get_global_llm_cache
 from langchain_groq import ChatGroq
+from .llm_cache import get_llm_cache
+from .config import LLM_MODEL
 
-def get_llm(api_key):
-    """Connect to Groq Llama 3."""
+def get_llm(api_key, cache=True):
+    """
+    Connect to Groq Llama 3.
+    cache=False skips the LLM cache (benchmarks, A/B timing).
+    """
     if not api_key: return None
-    # Temperature 0.0 for consistent logic/reasoning
-    return ChatGroq(groq_api_key=api_key, model_name="llama-3.3-70b-versatile", temperature=0.0)
\ No newline at end of file
+    # Temperature 0.0 for consistent logic/reasoning (which also makes every call safe to cache)
+    return ChatGroq(groq_api_key=api_key, model_name=LLM_MODEL, temperature=0.0,
+                    cache=get_llm_cache() if cache else False)
+
+def uncached(llm):
+    """The same LLM with the LLM cache off (final answers go through the answer cache instead)."""
+    if llm is None or llm.cache is False or (llm.cache is None and get_global_llm_cache() is None):
+        return llm  # not caching anyway
+    return llm.model_copy(update={"cache": False})
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+from .config import LLM_CACHE_MAX_ITEMS, LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL
+
+
+def cache_key(prompt, llm_string):
+    """
+    Content address of one LLM call.
+    `prompt` is the rendered template + inputs; `llm_string` carries the
+    model name and sampling params, so a different model never collides.
+    """
+    return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+def _encode(generations):
+    return json.dumps([
+        {"message": message_to_dict(g.message)} if isinstance(g, ChatGeneration) else {"text": g.text}
+        for g in generations
+    ])
+
+
+def _decode(payload):
+    generations = []
+    for item in json.loads(payload):
+        if "message" not in item:
+            generations.append(Generation(text=item["text"]))
+            continue
+        message = messages_from_dict([item["message"]])[0]
+        # A cache hit costs nothing: drop provider usage so it is not billed again
+        if hasattr(message, "usage_metadata"):
+            message.usage_metadata = None
+        message.response_metadata = {**message.response_metadata, "cache_hit": True}
+        generations.append(ChatGeneration(message=message))
+    return generations
+
+
+class TieredLLMCache(BaseCache):
+    """
+    LangChain cache for deterministic (temperature 0) calls.
+
+    Tier 1 is a bounded in-memory LRU; tier 2 is an optional SQLite file
+    that survives restarts, capped at `max_entries` (least recently used
+    go first) with entries expiring after `ttl` seconds. Disk hits are
+    promoted into memory.
+    """
+
+    def __init__(self, max_items=LLM_CACHE_MAX_ITEMS, path=LLM_CACHE_PATH,
+                 max_entries=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL):
+        self.max_items = max_items
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._conn = None
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(llm_cache)")}
+            if columns and "accessed" not in columns:
+                self._conn.execute("DROP TABLE llm_cache")  # file from before the cap/TTL: start over
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+            self._conn.commit()
+            self._disk_lock = threading.Lock()
+
+    def _remember(self, key, payload):
+        with self._lock:
+            self._memory[key] = payload
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def lookup(self, prompt, llm_string):
+        key = cache_key(prompt, llm_string)
+
+        with self._lock:
+            payload = self._memory.get(key)
+            if payload is not None:
+                self._memory.move_to_end(key)
+
+        if payload is None and self._conn is not None:
+            now = time.time()
+            with self._disk_lock:
+                row = self._conn.execute(
+                    "SELECT value FROM llm_cache WHERE key = ? AND created >= ?", (key, now - self.ttl)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+                    self._conn.commit()
+            if row is not None:
+                payload = row[0]
+                self._remember(key, payload)
+
+        return None if payload is None else _decode(payload)
+
+    def update(self, prompt, llm_string, return_val):
+        key = cache_key(prompt, llm_string)
+        payload = _encode(return_val)
+        self._remember(key, payload)
+
+        if self._conn is not None:
+            now = time.time()
+            with self._disk_lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, payload, now, now)
+                )
+                # TTL, then LRU
+                self._conn.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.ttl,))
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    " SELECT key FROM llm_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+                self._conn.commit()
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._memory.clear()
+        if self._conn is not None:
+            with self._disk_lock:
+                self._conn.execute("DELETE FROM llm_cache")
+                self._conn.commit()
+
+
+@lru_cache(maxsize=1)
+def get_llm_cache():
+    """One cache per process, shared by every LLM returned from get_llm."""
+    return TieredLLMCache()
@@ -1,152 +1,119 @@
+import asyncio
+import threading
 import time
-import re
+from collections import OrderedDict
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.documents import Document
-from langchain_community.retrievers import BM25Retriever
 
 # Import จาก Modules ข้างเคียง
-from .database import get_full_file_content
-from .config import DATA_FOLDER
+from .database import get_corpus_snapshot, get_docstore, get_bm25_index, get_full_file_content, collection_version
+from .ingest_engine import section_span
+from .answer_cache import CACHE_LOG_PREFIX
+from .reranker import get_reranker
+from .compression import get_compressor
+from .subquery import adecompose, arun_plan, plan_depth, subquery_chains
+from .concurrency import in_pool, run_sync, iter_async
+from .fusion import reciprocal_rank_fusion
+from .tracing import Trace, activate, current_trace, stage, traced, count
+from .cost import total_usage, count_tokens, tokens_estimated
+from .context_packer import context_budget, pack_context
+from .llm import uncached
+from .config import (
+    DATA_FOLDER, DEFAULT_RERANKER, DEFAULT_COMPRESSOR, PARENT_MODE, PARENT_WINDOW, SUBQUERY_K, PLAN_CACHE_SIZE,
+    CHUNK_SIZE, CHUNK_OVERLAP
+)
 
-def calculate_cost(text):
-    # คำนวณราคาคร่าวๆ (Llama 3 บน Groq ฟรี แต่เราโชว์ให้ดู Pro)
-    tokens = len(text) / 4
-    cost = (tokens / 1000) * 0.0005 
-    return int(tokens), cost
+# ลำดับขั้นตอนฝั่ง query (ก่อน retrieval) ที่ A/B แชร์กันได้
+QUERY_STAGES = ["Query Rewriting", "HyDE", "Multi-Query"]
+
+QUERY_PROMPTS = {
+    "Query Rewriting": ChatPromptTemplate.from_template(
+        "Rewrite this query to be specific for a search engine. Query: {q}"
+    ),
+    "HyDE": ChatPromptTemplate.from_template("Write a hypothetical answer to: {q}"),
+    "Multi-Query": ChatPromptTemplate.from_template("Generate 2 alternative search queries for: {q}. Sep by newline."),
+}
 
 def format_docs(docs):
     return "\n\n".join(f"[Source: {d.metadata.get('source_doc', 'Unknown')}] {d.page_content}" for d in docs)
 
-def merge_documents(v_docs, k_docs):
-    # รวมผลลัพธ์จาก Vector (v_docs) และ Keyword (k_docs) โดยตัดตัวซ้ำ
-    seen = set()
-    merged = []
-    max_len = max(len(v_docs), len(k_docs))
-    for i in range(max_len):
-        if i < len(v_docs):
-            d = v_docs[i]
-            if d.page_content not in seen:
-                merged.append(d)
-                seen.add(d.page_content)
-        if i < len(k_docs):
-            d = k_docs[i]
-            if d.page_content not in seen:
-                merged.append(d)
-                seen.add(d.page_content)
-    return merged
-
-def perform_rag(query, vector_db, llm, selected_techniques):
-    start_time = time.time()
-    current_query = query
-    docs = []
-    log_steps = []
+async def aprepare_queries(query, llm, selected_techniques, prepared=None, upto=len(QUERY_STAGES)):
+    """
+    Query-side stages, always in QUERY_STAGES order.
+    Resumes from `prepared` (an earlier result) and stops after `upto` stages,
+    so a shared prefix can be run once and finished per pipeline.
+    """
+    plan = get_pipeline_plan(selected_techniques, llm)
+    return await plan.aprepare(RunState(query, None, prepared), upto)
 
-    if not llm: return "API Key Missing", [], 0, 0, 0, []
+def prepare_queries(query, llm, selected_techniques, prepared=None, upto=len(QUERY_STAGES)):
+    """Sync aprepare_queries."""
+    return run_sync(aprepare_queries(query, llm, selected_techniques, prepared, upto))
 
+async def _arun_query_stage(name, state, chain):
     # 1. Query Rewriting
-    if "Query Rewriting" in selected_techniques:
-        prompt = ChatPromptTemplate.from_template(
-            "Rewrite this query to be specific for a search engine. Query: {q}"
-        )
-        new_query = (prompt | llm | StrOutputParser()).invoke({"q": query}).strip()
-        log_steps.append(f"🔄 Rewrote: '{query}' -> '{new_query}'")
-        current_query = new_query
+    if name == "Query Rewriting":
+        new_query = (await chain.ainvoke({"q": state["query"]})).strip()
+        state["logs"].append(f"🔄 Rewrote: '{state['query']}' -> '{new_query}'")
+        state["query"] = new_query
 
     # 2. HyDE
-    if "HyDE" in selected_techniques:
-        prompt = ChatPromptTemplate.from_template("Write a hypothetical answer to: {q}")
-        fake_ans = (prompt | llm | StrOutputParser()).invoke({"q": current_query})
-        log_steps.append("👻 HyDE: Generated hypothetical answer.")
-        current_query = f"{current_query} {fake_ans}"
+    elif name == "HyDE":
+        fake_ans = await chain.ainvoke({"q": state["query"]})
+        state["logs"].append("👻 HyDE: Generated hypothetical answer.")
+        state["query"] = f"{state['query']} {fake_ans}"
 
     # 3. Multi-Query
-    queries_to_run = [current_query]
-    if "Multi-Query" in selected_techniques:
-        prompt = ChatPromptTemplate.from_template("Generate 2 alternative search queries for: {q}. Sep by newline.")
-        vars = (prompt | llm | StrOutputParser()).invoke({"q": current_query}).split("\n")
+    elif name == "Multi-Query":
+        vars = (await chain.ainvoke({"q": state["query"]})).split("\n")
         cleaned_vars = [v.strip() for v in vars if v.strip()]
-        queries_to_run.extend(cleaned_vars[:2])
-        log_steps.append(f"🔀 Multi-Query: Added {len(cleaned_vars)} variations.")
+        state["variants"] = cleaned_vars[:2]
+        state["logs"].append(f"🔀 Multi-Query: Added {len(cleaned_vars)} variations.")
 
-    # --- RETRIEVAL ---
-    # ดึงข้อมูลจริงจาก DB
-    all_data = vector_db.get()
-    all_docs_objs = [Document(page_content=t, metadata=m) for t, m in zip(all_data['documents'], all_data['metadatas'])]
-    
-    temp_docs = []
-    INITIAL_K = 10 if ("Reranking" in selected_techniques) else 5
-    
-    for q in queries_to_run:
-        # Vector Search
-        v_res = vector_db.as_retriever(search_kwargs={"k": INITIAL_K}).invoke(q)
-        
-        # Keyword Search (Hybrid)
-        k_res = []
-        if "Hybrid Search" in selected_techniques:
-            bm25 = BM25Retriever.from_documents(all_docs_objs)
-            bm25.k = INITIAL_K
-            k_res = bm25.invoke(q)
-        
-        merged = merge_documents(v_res, k_res)
-        temp_docs.extend(merged)
-
-    docs = merge_documents(temp_docs, [])
-    log_steps.append(f"🔍 Retrieval: Pool of {len(docs)} docs found.")
-
-    # --- POST-PROCESSING ---
-
-    # 4. Reranking
-    if "Reranking" in selected_techniques and docs:
-        log_steps.append("🥇 Reranking: AI Scoring...")
-        scored = []
-        for d in docs:
-            # ใช้ LLM ให้คะแนน 0-10
-            prompt = ChatPromptTemplate.from_template(
-                "Rate relevance (0-10) of text to query '{q}'. Text: {t}. Output ONLY number."
-            )
-            try:
-                res = (prompt | llm | StrOutputParser()).invoke({"q": query, "t": d.page_content[:500]})
-                score = float(re.search(r'\d+', res).group())
-            except:
-                score = 5.0
-            d.metadata['score'] = score
-            scored.append(d)
-        # เรียงและตัดเหลือ Top 5
-        docs = sorted(scored, key=lambda x: x.metadata.get('score', 0), reverse=True)[:5]
-
-    # 5. Parent-Document
-    if "Parent-Document" in selected_techniques and docs:
-        log_steps.append("📂 Parent-Document: Fetching FULL files...")
-        new_docs = []
-        seen_src = set()
-        for d in docs:
-            fname = d.metadata.get('source_doc')
-            if fname and fname not in seen_src:
-                full_text = get_full_file_content(fname)
-                if not full_text.startswith("[Error"):
-                    new_d = Document(page_content=full_text, metadata=d.metadata)
-                    new_docs.append(new_d)
-                    seen_src.add(fname)
-        if new_docs: docs = new_docs[:2] # เอาแค่ 2 ไฟล์พอ เดี๋ยว Token เต็ม
-
-    # 6. Context Compression
-    if "Context Compression" in selected_techniques and docs:
-        log_steps.append("✂️ Compression: Extracting key info...")
-        compressed = []
-        for d in docs:
-            if len(d.page_content) > 500:
-                prompt = ChatPromptTemplate.from_template(
-                    "Extract only sentences answering '{q}' from text: {t}"
-                )
-                extracted = (prompt | llm | StrOutputParser()).invoke({"q": query, "t": d.page_content[:1500]})
-                d.page_content = extracted
-            compressed.append(d)
-        docs = compressed
+def shared_query_stages(techs_a, techs_b):
+    """Number of leading QUERY_STAGES that two pipelines configure identically."""
+    n = 0
+    for name in QUERY_STAGES:
+        if (name in techs_a) != (name in techs_b):
+            break
+        n += 1
+    return n
 
-    # --- GENERATION ---
-    template = """
+async def aretrieve_candidates(queries, vector_db, k, bm25=None, snapshot=None):
+    """
+    Vector + keyword search for every query variant, all in flight at once,
+    then one Reciprocal Rank Fusion pass over every result list.
+    Lists are fused in query order, so the pool is deterministic.
+    """
+    # BM25 ไม่ต้องรอ embedding ส่งเข้า pool ไปก่อนเลย
+    k_futs = [asyncio.ensure_future(in_pool(traced, "BM25", bm25.search, q, k)) for q in queries] if bm25 is not None else []
+
+    # Embed ทุก variant พร้อมกัน (CoalescingEmbeddings รวมเป็น batch เดียว และจำ vector ของ query ที่เคยเห็น)
+    with stage("Embed Queries", queries=len(queries)):
+        vectors = await asyncio.gather(*(vector_db.embeddings.aembed_query(q) for q in queries))
+    v_results = await asyncio.gather(*(
+        in_pool(traced, "Vector Search", vector_db.similarity_search_by_vector_with_relevance_scores, vec, k)
+        for vec in vectors
+    ))
+    k_results = await asyncio.gather(*k_futs)
+
+    # Chroma คืนค่า distance -> แปลงเป็น similarity (ยิ่งมากยิ่งใกล้)
+    try:
+        relevance = vector_db._select_relevance_score_fn()
+    except ValueError:
+        relevance = lambda dist: 1.0 / (1.0 + dist)
+
+    ranked_lists = []
+    for i in range(len(queries)):
+        ranked_lists.append(("vector", [(d, relevance(dist)) for d, dist in v_results[i]]))
+        if k_results:
+            ranked_lists.append(("bm25", [(snapshot.document(cid), s) for cid, s in k_results[i]]))
+
+    with stage("Fusion", lists=len(ranked_lists)):
+        return reciprocal_rank_fusion(ranked_lists, top_n=k)
+
+ANSWER_TEMPLATE = """
     Answer clearly based ONLY on context. If context is missing, say "I don't know".
     
     Context:
@@ -156,15 +123,576 @@ def perform_rag(query, vector_db, llm, selected_techniques):
     
     Answer:
     """
-    prompt = ChatPromptTemplate.from_template(template)
-    chain = {"context": lambda x: format_docs(docs), "question": RunnablePassthrough()} | prompt | llm | StrOutputParser()
-    
+
+ANSWER_PROMPT = ChatPromptTemplate.from_template(ANSWER_TEMPLATE)
+
+def generation_budget(query):
+    """Context tokens that fit next to ANSWER_TEMPLATE + query + answer reserve."""
+    return context_budget(count_tokens(ANSWER_TEMPLATE) + count_tokens(query))
+
+def tokens_label():
+    """'tokens', or 'tokens (estimated)' while there is no local tokenizer."""
+    return "tokens (estimated)" if tokens_estimated() else "tokens"
+
+async def asolve_subqueries(query, vector_db, planner, answerer):
+    """
+    Sub-Query: plan sub-questions, then retrieve + answer them as a DAG
+    (independent ones in parallel). Returns (plan, docs, notes doc).
+    """
+    with stage("Plan"):
+        plan = await adecompose(query, planner)
+    await arun_plan(plan, answerer, lambda q: in_pool(vector_db.similarity_search, q, k=SUBQUERY_K))
+
+    docs, seen = [], set()
+    for sq in plan:
+        for d in sq.docs:
+            key = d.id or d.metadata.get("chunk_id") or d.page_content
+            if key not in seen:
+                seen.add(key)
+                docs.append(d)
+    notes = Document(
+        page_content="\n".join(f"{sq.question} -> {sq.answer}" for sq in plan),
+        metadata={"source_doc": "Sub-Query answers"},
+    )
+    return plan, docs, notes
+
+def locate_parent(text, chunk, mode=PARENT_MODE, window=PARENT_WINDOW):
+    """
+    Parent span [start, end) for a chunk found by its text in the full file,
+    for hits ingested without position metadata. None if the text is not there.
+    """
+    start = text.find(chunk)
+    if start < 0:
+        return None
+    end = start + len(chunk)
+    if mode == "section":
+        return section_span(text, start, end)
+    # ±window chunk strides, widened to whole lines
+    reach = window * (CHUNK_SIZE - CHUNK_OVERLAP)
+    lo, hi = max(0, start - reach), min(len(text), end + reach)
+    lo = text.rfind("\n", 0, lo) + 1 if lo > 0 else 0
+    hi = text.find("\n", hi) if hi < len(text) else hi
+    return lo, (hi if hi >= 0 else len(text))
+
+def _merge_spans(file_spans, touching):
+    """Merge sorted (first, last, rank, hit) spans that overlap (or touch); keep the best rank's hit."""
+    file_spans.sort(key=lambda s: (s[0], s[1]))
+    first, last, rank, hit = file_spans[0]
+    for f, l, r, h in file_spans[1:]:
+        if f <= last + touching:
+            last = max(last, l)
+            if r < rank:
+                rank, hit = r, h
+        else:
+            yield first, last, rank, hit
+            first, last, rank, hit = f, l, r, h
+    yield first, last, rank, hit
+
+def expand_to_parents(docs, snapshot, mode=PARENT_MODE, window=PARENT_WINDOW, store=None):
+    """
+    Replace each hit with its parent span from the snapshot's adjacency index.
+    Overlapping or touching spans of one file are merged into one parent,
+    kept at the rank of its best hit. The text is sliced from the mmap'd
+    docstore when it has the file, else stitched from the snapshot's chunks.
+    Hits without position metadata (databases ingested before chunk layout 2)
+    are located by their text in the full file instead; hits that cannot be
+    found pass through. Returns (parents, number of hits expanded).
+    """
+    ranked, spans, located = [], {}, {}  # spans: source_doc -> [(first, last, rank, hit)] chunk indexes; located: char offsets
+    texts = {}
+    for rank, d in enumerate(docs):
+        rng = snapshot.parent_range(d.id or d.metadata.get("chunk_id"), mode, window)
+        if rng is not None:
+            spans.setdefault(rng[0], []).append((rng[1], rng[2], rank, d))
+            continue
+        src = d.metadata.get("source_doc")
+        if src and src not in texts:
+            texts[src] = get_full_file_content(src)
+        loc = locate_parent(texts[src], d.page_content, mode, window) if src else None
+        if loc is None:
+            ranked.append((rank, d))
+        else:
+            located.setdefault(src, []).append((loc[0], loc[1], rank, d))
+    expanded = len(docs) - len(ranked)
+
+    def parent(src, first, last, hit):
+        span = snapshot.char_span(src, first, last) if store is not None and src in store else None
+        return Document(
+            page_content=store.slice(src, *span) if span else snapshot.stitch(src, first, last),
+            metadata={**hit.metadata, "parent_chunks": f"{first}-{last}"},
+            id=hit.id,
+        )
+
+    for src, file_spans in spans.items():
+        for first, last, rank, hit in _merge_spans(file_spans, 1):
+            ranked.append((rank, parent(src, first, last, hit)))
+    for src, file_spans in located.items():
+        for start, end, rank, hit in _merge_spans(file_spans, 0):
+            ranked.append((rank, Document(
+                page_content=texts[src][start:end],
+                metadata={**hit.metadata, "parent_chars": f"{start}-{end}"},
+                id=hit.id,
+            )))
+
+    return [d for _, d in sorted(ranked, key=lambda r: r[0])], expanded
+
+def lookup_answer_cache(query, vector_db, selected_techniques, reranker, compressor, answer_cache):
+    """
+    Answer Cache: ตรงตัวก่อน แล้วค่อยเทียบความหมายด้วย embedding
+    Returns (hit or None, variant, query embedding or None).
+    """
+    variant = f"{','.join(sorted(selected_techniques))}|{reranker}|{compressor}|{collection_version(vector_db)}"
+    query_vec = None
+    hit = answer_cache.get(query, variant)
+    if hit is None:
+        query_vec = vector_db.embeddings.embed_query(query)
+        hit = answer_cache.get_similar(query_vec, variant)
+    return hit, variant, query_vec
+
+# --- Pipeline plans: stages compiled once per technique set ---
+
+class RunState:
+    """One question on its way through a plan's stages."""
+
+    def __init__(self, query, vector_db, prepared=None):
+        self.query = query
+        self.vector_db = vector_db
+        # Query-side state, possibly resumed from a shared A/B prefix
+        self.prepared = dict(prepared) if prepared else {"query": query, "variants": [], "logs": [], "stages": 0}
+        self.prepared["logs"] = list(self.prepared["logs"])
+        self.docs = []
+        self.notes = None  # Sub-Query answers, put in front of the context at packing
+
+class Stage:
+    """
+    One step of a PipelinePlan. `arun(run)` is an async generator of log
+    lines that updates the RunState. Stages never keep a span open across
+    a yield: run_retrieval resumes every step in a fresh task, which would
+    not see a span opened in the previous one.
+    """
+
+    name = "stage"
+
+    async def arun(self, run):
+        raise NotImplementedError
+        yield
+
+class QueryStage(Stage):
+    """Query Rewriting / HyDE / Multi-Query, with its chain prebuilt."""
+
+    def __init__(self, name, llm):
+        self.name = name
+        self.position = QUERY_STAGES.index(name)
+        self.chain = QUERY_PROMPTS[name] | llm | StrOutputParser()
+
+    async def arun(self, run):
+        state = run.prepared
+        if state["stages"] > self.position:  # already ran as part of a shared prefix
+            return
+        state["stages"] = self.position + 1
+        before = len(state["logs"])
+        with stage(self.name):
+            await _arun_query_stage(self.name, state, self.chain)
+        for line in state["logs"][before:]:
+            yield line
+
+class RetrievalStage(Stage):
+    name = "Retrieval"
+
+    def __init__(self, k, hybrid):
+        self.k = k
+        self.hybrid = hybrid
+
+    async def arun(self, run):
+        queries_to_run = [run.prepared["query"]] + run.prepared["variants"]
+        vector_db = run.vector_db
+        with stage("Retrieval", k=self.k, queries=len(queries_to_run)) as span:
+            # BM25 ถูกสร้างไว้ตอน ingest แล้ว โหลด corpus เฉพาะตอนที่ใช้ Hybrid เท่านั้น
+            snapshot = bm25 = None
+            if self.hybrid:
+                with stage("Load BM25 Index"):
+                    snapshot = await in_pool(get_corpus_snapshot, vector_db)
+                    bm25 = await in_pool(get_bm25_index, vector_db._collection.name, snapshot)
+
+            run.docs = await aretrieve_candidates(queries_to_run, vector_db, self.k, bm25, snapshot)
+            if span is not None:
+                span.attributes["pool_size"] = len(run.docs)
+        count("retrieval_pool", len(run.docs))
+        yield f"🔍 Retrieval: Pool of {len(run.docs)} docs found."
+
+class SubQueryStage(Stage):
+    """Sub-questions that don't depend on each other run at the same time; a dependent one waits only for its own inputs."""
+
+    name = "Sub-Query"
+
+    def __init__(self, llm):
+        self.planner, self.answerer = subquery_chains(llm)
+
+    async def arun(self, run):
+        t0 = time.perf_counter()
+        with stage("Sub-Query") as span:
+            plan, sub_docs, run.notes = await asolve_subqueries(run.query, run.vector_db, self.planner, self.answerer)
+            known = {d.id for d in run.docs if d.id}
+            run.docs = run.docs + [d for d in sub_docs if not d.id or d.id not in known]
+            if span is not None:
+                span.attributes.update(questions=len(plan), depth=plan_depth(plan))
+        yield (f"🧩 Sub-Query: {len(plan)} sub-questions in {plan_depth(plan)} dependent step(s), "
+               f"{time.perf_counter() - t0:.2f}s; pool now {len(run.docs)} docs.")
+
+class RerankStage(Stage):
+    name = "Reranking"
+
+    def __init__(self, backend, llm):
+        self.backend = backend
+        self.reranker = get_reranker(backend, llm)
+
+    async def arun(self, run):
+        if not run.docs:
+            return
+        yield f"🥇 Reranking: {self.backend} Scoring..."
+        # ให้คะแนน 0-10 แล้วตัดเหลือ Top 5
+        with stage("Reranking", backend=self.backend, candidates=len(run.docs)):
+            run.docs = await self.reranker.arerank(run.query, run.docs)
+
+class ParentStage(Stage):
+    name = "Parent-Document"
+
+    def __init__(self, mode=PARENT_MODE, window=PARENT_WINDOW):
+        self.mode = mode
+        self.window = window
+
+    async def arun(self, run):
+        if not run.docs:
+            return
+        hits = len(run.docs)
+        with stage("Parent-Document", mode=self.mode) as span:
+            snapshot = await in_pool(get_corpus_snapshot, run.vector_db)
+            parents, expanded = await in_pool(
+                expand_to_parents, run.docs, snapshot, self.mode, self.window, store=get_docstore()
+            )
+            if span is not None:
+                span.attributes["expanded"] = expanded
+            if expanded:
+                # ช่วงที่ขยายแล้วอาจยาว: ใส่ตามลำดับความเกี่ยวข้องจนเต็ม token budget (ตัดเป็นประโยคถ้าจำเป็น)
+                budget = generation_budget(run.query)
+                run.docs, used, trimmed, dropped = pack_context(parents, run.query, budget)
+        if not expanded:
+            yield "📂 Parent-Document: no parent metadata, using chunks as-is."
+            return
+        scope = "sections" if self.mode == "section" else f"±{self.window} chunk windows"
+        yield f"📂 Parent-Document: Expanded {expanded}/{hits} hits to {len(parents)} {scope}."
+        yield f"📦 Packed {len(run.docs)} parents into {used}/{budget} {tokens_label()} ({trimmed} trimmed, {dropped} dropped)."
+
+class CompressionStage(Stage):
+    name = "Context Compression"
+
+    def __init__(self, backend, llm):
+        self.backend = backend
+        self.llm = llm
+        self._built = (None, None)  # (embeddings, compressor): the extractive one needs the DB's embeddings
+
+    def compressor(self, embeddings):
+        built_for, compressor = self._built
+        if compressor is None or built_for is not embeddings:
+            compressor = get_compressor(self.backend, self.llm, embeddings)
+            self._built = (embeddings, compressor)
+        return compressor
+
+    async def arun(self, run):
+        if not run.docs:
+            return
+        yield f"✂️ Compression: Extracting key info ({self.backend})..."
+        with stage("Context Compression", backend=self.backend, docs=len(run.docs)):
+            run.docs = await self.compressor(run.vector_db.embeddings).acompress(run.query, run.docs)
+
+class PackingStage(Stage):
+    """The generation prompt must always fit the budget."""
+
+    name = "Context Packing"
+
+    async def arun(self, run):
+        if run.notes is not None:
+            run.docs = [run.notes] + run.docs  # sub-answers first, so they are never the part that gets cut
+        with stage("Context Packing"):
+            budget = generation_budget(run.query)
+            run.docs, used, trimmed, dropped = pack_context(run.docs, run.query, budget)
+        if trimmed or dropped:
+            yield f"📦 Context Packing: {len(run.docs)} docs in {used}/{budget} {tokens_label()} ({trimmed} trimmed, {dropped} dropped)."
+
+class PipelinePlan:
+    """
+    A technique set compiled into an ordered list of stages, with every
+    prompt template and LLM chain (query stages, reranker, compressor,
+    sub-query, answer) built once. A plan holds no per-question state, so
+    one plan serves any number of concurrent runs. Build one from your own
+    `stages` list for a custom order.
+    """
+
+    def __init__(self, stages, llm):
+        self.stages = list(stages)
+        # Final answers skip the LLM cache: repeats are the answer cache's job (and only when it is on)
+        self.answer = ANSWER_PROMPT | uncached(llm) | StrOutputParser()
+
+    @classmethod
+    def compile(cls, selected_techniques, llm, reranker=DEFAULT_RERANKER, compressor=DEFAULT_COMPRESSOR):
+        techs = set(selected_techniques)
+        stages = [QueryStage(name, llm) for name in QUERY_STAGES if name in techs]
+        stages.append(RetrievalStage(k=10 if "Reranking" in techs else 5, hybrid="Hybrid Search" in techs))
+        if "Sub-Query" in techs:
+            stages.append(SubQueryStage(llm))
+        if "Reranking" in techs:
+            stages.append(RerankStage(reranker, llm))
+        if "Parent-Document" in techs:
+            stages.append(ParentStage())
+        if "Context Compression" in techs:
+            stages.append(CompressionStage(compressor, llm))
+        stages.append(PackingStage())
+        return cls(stages, llm)
+
+    async def aprepare(self, run, upto=len(QUERY_STAGES)):
+        """Query stages before QUERY_STAGES[upto]; returns the (resumable) query-side state."""
+        for s in self.stages:
+            if isinstance(s, QueryStage) and s.position < upto:
+                async for _ in s.arun(run):
+                    pass
+        run.prepared["stages"] = max(run.prepared["stages"], upto)
+        return run.prepared
+
+    async def aretrieve(self, query, vector_db, prepared=None):
+        """
+        Every stage, as ("log", line) events and then ("docs", final docs).
+        The log lines of a shared prefix in `prepared` come first: its stages
+        are skipped here, and without them an A/B column would lose its
+        rewrite / HyDE / Multi-Query lines.
+        """
+        run = RunState(query, vector_db, prepared)
+        for line in run.prepared["logs"]:
+            yield ("log", line)
+        for s in self.stages:
+            async for line in s.arun(run):
+                yield ("log", line)
+        yield ("docs", run.docs)
+
+# (techniques, reranker, compressor, id(llm)) -> PipelinePlan, least recently used first
+_plans = OrderedDict()
+_plans_lock = threading.Lock()
+
+def load_pipeline_plan(techniques, reranker, compressor, llm):
+    """
+    One compiled plan per (technique set, backends, LLM), shared by every
+    session / request of the process. Keyed on id(llm) (LLM objects are not
+    hashable); the plan keeps `llm` alive, so the id cannot be reused while cached.
+    """
+    key = (techniques, reranker, compressor, id(llm))
+    with _plans_lock:
+        plan = _plans.get(key)
+        if plan is None:
+            plan = _plans[key] = PipelinePlan.compile(techniques, llm, reranker, compressor)
+        _plans.move_to_end(key)
+        while len(_plans) > PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+    return plan
+
+def get_pipeline_plan(selected_techniques, llm, reranker=DEFAULT_RERANKER, compressor=DEFAULT_COMPRESSOR):
+    """
+    Compiled plan for a technique list in any order: a PIPELINE_PRESETS entry
+    and the same boxes ticked by hand share one plan.
+    """
+    return load_pipeline_plan(tuple(sorted(set(selected_techniques))), reranker, compressor, llm)
+
+async def arun_retrieval(query, vector_db, llm, selected_techniques, reranker=DEFAULT_RERANKER, prepared=None,
+                         compressor=DEFAULT_COMPRESSOR):
+    """
+    Every stage before generation, as an async generator of events:
+    ("log", line) as each stage finishes, then ("docs", final docs).
+    A shared prefix passed as `prepared` is not re-run, but its log lines
+    are replayed first.
+    """
+    plan = get_pipeline_plan(selected_techniques, llm, reranker, compressor)
+    async for event in plan.aretrieve(query, vector_db, prepared):
+        yield event
+
+def run_retrieval(query, vector_db, llm, selected_techniques, reranker=DEFAULT_RERANKER, prepared=None,
+                  compressor=DEFAULT_COMPRESSOR):
+    """
+    Sync arun_retrieval, as a generator: yields a log line as each stage
+    finishes and returns the final docs (use `docs = yield from run_retrieval(...)`).
+    """
+    docs = []
+    events = arun_retrieval(query, vector_db, llm, selected_techniques, reranker, prepared, compressor)
+    for kind, payload in iter_async(events):
+        if kind == "log":
+            yield payload
+        else:
+            docs = payload
+    return docs
+
+async def aperform_rag(query, vector_db, llm, selected_techniques, reranker=DEFAULT_RERANKER, answer_cache=None,
+                      prepared=None, trace=None, compressor=DEFAULT_COMPRESSOR):
+    """
+    Run the whole pipeline; returns (answer, docs, lat, tokens, cost, log_steps).
+    LLM calls are awaited (ainvoke) and retriever / embedding calls run on the
+    shared pool, so one event loop can serve many questions at once.
+    Pass a tracing.Trace as `trace` to have every stage recorded into it.
+    tokens/cost add up every LLM call of this run (rewrite, HyDE, rerank, ...).
+    """
+    # Tokens/cost come from the trace, so there always is one
+    trace = trace or current_trace() or Trace()
+    with activate(trace), stage("perform_rag", techniques=",".join(selected_techniques)) as root:
+        answer, docs, lat, log_steps = await _aperform_rag(query, vector_db, llm, selected_techniques, reranker, compressor, answer_cache, prepared)
+    tokens, cost = total_usage(trace.subtree(root))
+    return answer, docs, lat, tokens, cost, log_steps
+
+def perform_rag(query, vector_db, llm, selected_techniques, reranker=DEFAULT_RERANKER, answer_cache=None, prepared=None, trace=None,
+                compressor=DEFAULT_COMPRESSOR):
+    """Sync aperform_rag (same arguments and result)."""
+    return run_sync(aperform_rag(query, vector_db, llm, selected_techniques, reranker, answer_cache, prepared, trace, compressor))
+
+async def _aperform_rag(query, vector_db, llm, selected_techniques, reranker, compressor, answer_cache, prepared):
+    start_time = time.time()
+    log_steps = []
+
+    if not llm: return "API Key Missing", [], 0, []
+
+    # 0. Answer Cache
+    if answer_cache is not None:
+        with stage("Answer Cache"):
+            hit, variant, query_vec = await in_pool(lookup_answer_cache, query, vector_db, selected_techniques, reranker, compressor, answer_cache)
+        if hit is not None:
+            log_steps.append(f"{CACHE_LOG_PREFIX}: {hit.kind} hit (similarity {hit.similarity:.2f}), skipped pipeline.")
+            return hit.answer, hit.docs, time.time() - start_time, log_steps + hit.log_steps
+
+    # 1-7. Retrieval stages
+    plan = get_pipeline_plan(selected_techniques, llm, reranker, compressor)
+    docs = []
+    async for kind, payload in plan.aretrieve(query, vector_db, prepared):
+        if kind == "log":
+            log_steps.append(payload)
+        else:
+            docs = payload
+
+    # --- GENERATION ---
     try:
-        answer = chain.invoke(query)
+        with stage("Generation"):
+            answer = await plan.answer.ainvoke({"context": format_docs(docs), "question": query})
     except Exception as e:
         answer = f"Error: {e}"
+    else:
+        if answer_cache is not None:
+            await in_pool(answer_cache.put, query, variant, query_vec, answer, docs, log_steps)
+
+    return answer, docs, time.time() - start_time, log_steps
+
+def stream_rag(query, vector_db, llm, selected_techniques, reranker=DEFAULT_RERANKER, answer_cache=None,
+               compressor=DEFAULT_COMPRESSOR):
+    """
+    Streaming variant of perform_rag, as a generator of (kind, payload) events:
+      ("log", line)   as each stage finishes
+      ("token", text) answer chunks as the LLM produces them
+      ("done", dict)  answer, docs, lat, ttft, tokens, cost, logs, trace
+    `ttft` is time to first answer token, measured from the start of the call.
+    """
+    trace = Trace("stream_rag")
+    done = None
+    with activate(trace), stage("stream_rag", techniques=",".join(selected_techniques)):
+        for event in _stream_rag(query, vector_db, llm, selected_techniques, reranker, compressor, answer_cache):
+            if event[0] == "done":
+                done = event
+            else:
+                yield event
+    # ปิด root span ก่อนส่ง trace ออกไป
+    done[1]["tokens"], done[1]["cost"] = total_usage(trace.spans)
+    done[1]["trace"] = trace
+    yield done
+
+def _stream_rag(query, vector_db, llm, selected_techniques, reranker, compressor, answer_cache):
+    start_time = time.time()
+    log_steps = []
+
+    def done(answer, docs, ttft):
+        return ("done", {
+            "answer": answer, "docs": docs, "lat": time.time() - start_time, "ttft": ttft,
+            "logs": log_steps
+        })
+
+    if not llm:
+        yield ("token", "API Key Missing")
+        yield done("API Key Missing", [], 0.0)
+        return
+
+    # 0. Answer Cache
+    if answer_cache is not None:
+        with stage("Answer Cache"):
+            hit, variant, query_vec = lookup_answer_cache(query, vector_db, selected_techniques, reranker, compressor, answer_cache)
+        if hit is not None:
+            log_steps.append(f"{CACHE_LOG_PREFIX}: {hit.kind} hit (similarity {hit.similarity:.2f}), skipped pipeline.")
+            log_steps.extend(hit.log_steps)
+            for line in log_steps:
+                yield ("log", line)
+            yield ("token", hit.answer)
+            yield done(hit.answer, hit.docs, time.time() - start_time)
+            return
+
+    # 1-7. Retrieval stages
+    plan = get_pipeline_plan(selected_techniques, llm, reranker, compressor)
+    steps = run_retrieval(query, vector_db, llm, selected_techniques, reranker, compressor=compressor)
+    while True:
+        try:
+            line = next(steps)
+        except StopIteration as stop:
+            docs = stop.value
+            break
+        log_steps.append(line)
+        yield ("log", line)
+
+    # --- GENERATION (streamed) ---
+    parts, ttft = [], None
+    try:
+        with stage("Generation"):
+            for chunk in plan.answer.stream({"context": format_docs(docs), "question": query}):
+                if ttft is None:
+                    ttft = time.time() - start_time
+                parts.append(chunk)
+                yield ("token", chunk)
+    except Exception as e:
+        parts.append(f"Error: {e}")
+        yield ("token", parts[-1])
+        answer = "".join(parts)
+    else:
+        answer = "".join(parts)
+        if answer_cache is not None:
+            answer_cache.put(query, variant, query_vec, answer, docs, log_steps)
+
+    yield done(answer, docs, ttft if ttft is not None else time.time() - start_time)
+
+async def acompare_pipelines(query, vector_db, llm, techs_a, techs_b, reranker_a=DEFAULT_RERANKER, reranker_b=DEFAULT_RERANKER):
+    """
+    Run two pipelines concurrently for A/B testing.
+    Leading query stages both configure identically run once and are reused.
+    Returns (result_a, result_b, shared): each result's latency/tokens/cost
+    exclude the shared part, which is reported once in `shared`
+    ({"lat", "tokens", "cost"}).
+    """
+    n_shared = shared_query_stages(techs_a, techs_b)
+    prepared = None
+    shared = {"lat": 0.0, "tokens": 0, "cost": 0.0}
+
+    if llm and any(name in techs_a for name in QUERY_STAGES[:n_shared]):
+        t0 = time.time()
+        trace = Trace("shared")
+        with activate(trace):
+            prepared = await aprepare_queries(query, llm, techs_a, upto=n_shared)
+        shared["tokens"], shared["cost"] = total_usage(trace.spans)
+        shared["lat"] = time.time() - t0
+        prepared["logs"] = [f"🤝 Shared: {log}" for log in prepared["logs"]]
 
-    lat = time.time() - start_time
-    tokens, cost = calculate_cost(query + format_docs(docs) + answer)
+    # Each side gets its own Trace, so tokens/cost are not mixed up
+    res_a, res_b = await asyncio.gather(
+        aperform_rag(query, vector_db, llm, techs_a, reranker_a, prepared=prepared, trace=Trace()),
+        aperform_rag(query, vector_db, llm, techs_b, reranker_b, prepared=prepared, trace=Trace()),
+    )
+    return res_a, res_b, shared
 
-    return answer, docs, lat, tokens, cost, log_steps
\ No newline at end of file
+def compare_pipelines(query, vector_db, llm, techs_a, techs_b, reranker_a=DEFAULT_RERANKER, reranker_b=DEFAULT_RERANKER):
+    """Sync acompare_pipelines (same arguments and result)."""
+    return run_sync(acompare_pipelines(query, vector_db, llm, techs_a, techs_b, reranker_a, reranker_b))
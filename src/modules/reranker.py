@@ -0,0 +1,180 @@
+import math
+import re
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+
+from .concurrency import run_concurrently, arun_concurrently, in_pool
+from .database import get_cross_encoder
+from .config import (
+    RERANK_TOP_N, RERANK_MAX_CONCURRENCY, RERANK_TIMEOUT, RERANK_BATCH_SIZE
+)
+
+DEFAULT_SCORE = 5.0
+
+SCORE_PROMPT = ChatPromptTemplate.from_template(
+    "Rate relevance (0-10) of text to query '{q}'. Text: {t}. Output ONLY number."
+)
+
+BATCH_SCORE_PROMPT = ChatPromptTemplate.from_template(
+    "Rate the relevance (0-10) of each numbered text to the query '{q}'.\n\n"
+    "{texts}\n\n"
+    "Output ONLY {n} numbers separated by commas, one per text, in the same order."
+)
+
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+def parse_score(text):
+    """First number in the reply, clamped to 0-10."""
+    m = _NUMBER.search(text or "")
+    if not m:
+        return DEFAULT_SCORE
+    return min(max(float(m.group()), 0.0), 10.0)
+
+
+def parse_score_list(text, n):
+    """
+    Parse n scores from a batched reply.
+    Accepts "8, 3, 5" as well as numbered lines like "1. 8"; pads with the default.
+    """
+    nums = [float(x) for x in _NUMBER.findall(text or "")]
+    # "1. 8\n2. 3" -> drop the enumeration
+    if len(nums) >= 2 * n and all(nums[2 * i] == i + 1 for i in range(n)):
+        nums = nums[1::2]
+    scores = [min(max(x, 0.0), 10.0) for x in nums[:n]]
+    return scores + [DEFAULT_SCORE] * (n - len(scores))
+
+
+class Reranker:
+    """Base class: subclasses implement score(query, docs)."""
+
+    name = "base"
+
+    def score(self, query, docs):
+        raise NotImplementedError
+
+    async def ascore(self, query, docs):
+        """Async score(); by default the sync one runs on the shared pool."""
+        return await in_pool(self.score, query, docs)
+
+    @staticmethod
+    def _top(docs, scores, top_n):
+        for d, s in zip(docs, scores):
+            d.metadata['score'] = s
+        return sorted(docs, key=lambda x: x.metadata.get('score', 0), reverse=True)[:top_n]
+
+    def rerank(self, query, docs, top_n=RERANK_TOP_N):
+        """Attach `score` metadata and keep the top_n documents."""
+        return self._top(docs, self.score(query, docs), top_n)
+
+    async def arerank(self, query, docs, top_n=RERANK_TOP_N):
+        return self._top(docs, await self.ascore(query, docs), top_n)
+
+
+class LLMReranker(Reranker):
+    """
+    Scores retrieved documents with the chat LLM.
+
+    Calls run concurrently (bounded by `max_concurrency`), so wall time is
+    close to the slowest call instead of the sum. With `batch_size > 1`
+    several documents are scored in one prompt.
+    """
+
+    name = "LLM"
+
+    def __init__(self, llm, max_concurrency=RERANK_MAX_CONCURRENCY,
+                 timeout=RERANK_TIMEOUT, batch_size=RERANK_BATCH_SIZE):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.batch_size = max(1, batch_size)
+        self.chain = SCORE_PROMPT | llm | StrOutputParser()
+        self.batch_chain = BATCH_SCORE_PROMPT | llm | StrOutputParser()
+
+    def _score_one(self, query, doc):
+        return parse_score(self.chain.invoke({"q": query, "t": doc.page_content[:500]}))
+
+    async def _ascore_one(self, query, doc):
+        return parse_score(await self.chain.ainvoke({"q": query, "t": doc.page_content[:500]}))
+
+    @staticmethod
+    def _batch_input(query, docs):
+        texts = "\n\n".join(f"[{i + 1}] {d.page_content[:500]}" for i, d in enumerate(docs))
+        return {"q": query, "texts": texts, "n": len(docs)}
+
+    def _score_batch(self, query, docs):
+        return parse_score_list(self.batch_chain.invoke(self._batch_input(query, docs)), len(docs))
+
+    async def _ascore_batch(self, query, docs):
+        return parse_score_list(await self.batch_chain.ainvoke(self._batch_input(query, docs)), len(docs))
+
+    def _groups(self, docs):
+        return [docs[i:i + self.batch_size] for i in range(0, len(docs), self.batch_size)]
+
+    @staticmethod
+    def _merge(groups, results):
+        scores = []
+        for group, group_scores in zip(groups, results):
+            scores.extend(group_scores or [DEFAULT_SCORE] * len(group))
+        return scores
+
+    def score(self, query, docs):
+        """Return one relevance score (0-10) per document, in order."""
+        if self.batch_size == 1:
+            scores = run_concurrently(
+                lambda d: self._score_one(query, d), docs,
+                self.max_concurrency, self.timeout
+            )
+            return [DEFAULT_SCORE if s is None else s for s in scores]
+
+        groups = self._groups(docs)
+        results = run_concurrently(
+            lambda g: self._score_batch(query, g), groups,
+            self.max_concurrency, self.timeout
+        )
+        return self._merge(groups, results)
+
+    async def ascore(self, query, docs):
+        """score() on the event loop: every call awaited via ainvoke, same limits."""
+        if self.batch_size == 1:
+            scores = await arun_concurrently(
+                lambda d: self._ascore_one(query, d), docs,
+                self.max_concurrency, self.timeout
+            )
+            return [DEFAULT_SCORE if s is None else s for s in scores]
+
+        groups = self._groups(docs)
+        results = await arun_concurrently(
+            lambda g: self._ascore_batch(query, g), groups,
+            self.max_concurrency, self.timeout
+        )
+        return self._merge(groups, results)
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    Local sentence-transformers CrossEncoder on CPU.
+    All (query, doc) pairs go through one batched forward pass.
+    """
+
+    name = "Cross-Encoder"
+
+    def __init__(self, model=None):
+        self.model = model or get_cross_encoder()
+
+    def score(self, query, docs):
+        if not docs:
+            return []
+        logits = self.model.predict(
+            [(query, d.page_content) for d in docs],
+            batch_size=len(docs), show_progress_bar=False
+        )
+        # Sigmoid onto the same 0-10 scale as the LLM scorer
+        return [10.0 / (1.0 + math.exp(-float(x))) for x in logits]
+
+
+def get_reranker(backend, llm):
+    """Build the reranker for a pipeline's chosen backend."""
+    if backend == CrossEncoderReranker.name:
+        return CrossEncoderReranker()
+    return LLMReranker(llm)
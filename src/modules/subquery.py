@@ -0,0 +1,145 @@
+import asyncio
+import json
+import re
+import time
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+
+from .tracing import stage
+from .config import SUBQUERY_MAX_QUESTIONS, SUBQUERY_MAX_CONCURRENCY, SUBQUERY_TIMEOUT
+
+PLAN_PROMPT = ChatPromptTemplate.from_template(
+    "Break the question into at most {n} simple sub-questions, each answerable from one search. "
+    "If a sub-question needs the answer of an earlier one, list that id in depends_on. "
+    'Reply with JSON only, like [{{"id": 1, "question": "...", "depends_on": []}}]. '
+    "Question: {q}"
+)
+
+ANSWER_PROMPT = ChatPromptTemplate.from_template(
+    "Answer briefly using ONLY the context. If the answer is not there, say \"unknown\".\n"
+    "{facts}"
+    "Context:\n{context}\n\n"
+    "Sub-question: {q}"
+)
+
+UNKNOWN = "unknown"
+_NUMBERED = re.compile(r"^\s*\d+[.)]\s*(.+?)\s*$", re.M)
+
+
+class SubQuestion:
+    """One node of the plan; filled in with its answer, docs and seconds when solved."""
+
+    def __init__(self, sid, question, depends_on=()):
+        self.id = sid
+        self.question = question
+        self.depends_on = list(depends_on)
+        self.answer = None
+        self.docs = []
+        self.seconds = 0.0
+
+
+def _plan_id(value):
+    """Key for an id the planner wrote (1, "1" and 1.0 alike); None unless it is a scalar."""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def parse_plan(text, query, limit=SUBQUERY_MAX_QUESTIONS):
+    """
+    Sub-questions from the planner's reply. Dependencies may only point at
+    earlier sub-questions, so the graph is always acyclic. Falls back to
+    numbered lines (no dependencies), then to the question itself.
+    Ids and dependencies that are not scalars (e.g. {"id": 1}) are ignored.
+    """
+    items = None
+    start, end = (text or "").find("["), (text or "").rfind("]")
+    if start != -1 and end > start:
+        try:
+            items = json.loads(text[start:end + 1])
+        except ValueError:
+            items = None
+
+    plan, ids = [], {}
+    if isinstance(items, list):
+        for item in items:
+            if len(plan) >= limit:
+                break
+            if not isinstance(item, dict) or not str(item.get("question", "")).strip():
+                continue
+            sid = len(plan) + 1
+            deps = item.get("depends_on") or []
+            deps = [_plan_id(d) for d in (deps if isinstance(deps, list) else [deps])]
+            deps = [ids[d] for d in deps if d in ids]
+            key = _plan_id(item.get("id", sid))
+            if key is not None:
+                ids[key] = sid
+            plan.append(SubQuestion(sid, str(item["question"]).strip(), sorted(set(deps))))
+    if not plan:
+        lines = _NUMBERED.findall(text or "")[:limit]
+        plan = [SubQuestion(i + 1, q) for i, q in enumerate(lines)]
+    return plan or [SubQuestion(1, query)]
+
+
+def subquery_chains(llm):
+    """(planner, answerer) chains for `llm`; built once per compiled pipeline plan."""
+    return PLAN_PROMPT | llm | StrOutputParser(), ANSWER_PROMPT | llm | StrOutputParser()
+
+
+def plan_depth(plan):
+    """Longest dependency chain: the number of LLM round trips that cannot overlap."""
+    depth = {}
+    for sq in plan:  # dependencies always come earlier
+        depth[sq.id] = 1 + max((depth[d] for d in sq.depends_on), default=0)
+    return max(depth.values(), default=0)
+
+
+async def _asolve(question, inputs, answerer, aretrieve):
+    """(answer, docs) for one sub-question, given its dependencies' answers."""
+    search = " ".join([question] + [a for a in inputs.values() if a != UNKNOWN])
+    docs = await aretrieve(search)
+    facts = "".join(f"Known: {q} -> {a}\n" for q, a in inputs.items())
+    context = "\n\n".join(d.page_content for d in docs)
+    answer = await answerer.ainvoke({"facts": facts, "context": context, "q": question})
+    return answer.strip() or UNKNOWN, docs
+
+
+async def arun_plan(plan, answerer, aretrieve, max_concurrency=SUBQUERY_MAX_CONCURRENCY, timeout=SUBQUERY_TIMEOUT):
+    """
+    Solve every sub-question (retrieve, then answer) as one task per node.
+    A node starts as soon as all of its dependencies are answered, with at
+    most `max_concurrency` solving at once. A node that fails or runs past
+    `timeout` seconds is answered "unknown" and its dependents still run.
+    `answerer` is the ANSWER_PROMPT chain (see subquery_chains) and
+    `aretrieve(text)` an async search returning Documents.
+    """
+    gate = asyncio.Semaphore(max(1, max_concurrency))
+    tasks = {}
+
+    async def solve(sq):
+        await asyncio.gather(*(tasks[d] for d in sq.depends_on))  # never raise, see below
+        inputs = {by_id[d].question: by_id[d].answer for d in sq.depends_on}
+        async with gate:
+            t0 = time.perf_counter()
+            with stage("Sub-Question"):
+                try:
+                    sq.answer, sq.docs = await asyncio.wait_for(
+                        _asolve(sq.question, inputs, answerer, aretrieve), timeout
+                    )
+                except Exception:
+                    sq.answer = UNKNOWN
+            sq.seconds = time.perf_counter() - t0
+
+    by_id = {sq.id: sq for sq in plan}
+    for sq in plan:  # dependencies always come earlier, so their tasks exist
+        tasks[sq.id] = asyncio.ensure_future(solve(sq))
+    await asyncio.gather(*tasks.values())
+    return plan
+
+
+async def adecompose(query, planner, limit=SUBQUERY_MAX_QUESTIONS):
+    """Ask the planner chain (see subquery_chains) for at most `limit` sub-questions."""
+    return parse_plan(await planner.ainvoke({"q": query, "n": limit}), query, limit)
@@ -0,0 +1,289 @@
+import json
+import os
+import threading
+import time
+import contextvars
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+from .cost import generation_usage, price
+
+# Active trace / innermost open span for this call chain (None = tracing off, zero cost).
+# Work handed to the shared pool keeps them via concurrency.submit (context copy).
+_trace = contextvars.ContextVar("ragscope_trace", default=None)
+_span = contextvars.ContextVar("ragscope_span", default=None)
+
+# LangChain adds the value of this var to the callbacks of every run started in
+# the same context, which is how LLM calls find the span they belong to.
+_llm_handler = contextvars.ContextVar("ragscope_trace_handler", default=None)
+register_configure_hook(_llm_handler, inheritable=True)
+
+
+class Span:
+    """One timed stage: wall-clock start/end (ns), LLM calls, tokens and cost made inside it."""
+
+    def __init__(self, name, parent_id=None, attributes=None):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.llm_calls = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.cost = 0.0
+        self.cache_hits = 0       # calls answered by the LLM cache (free)
+        self.estimated_calls = 0  # calls without provider usage, counted locally
+
+    @property
+    def duration(self):
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e9
+
+
+class Trace:
+    """
+    Spans of one pipeline run. Filled by `stage()` blocks and by LLM
+    callbacks; safe to write from several threads.
+    """
+
+    def __init__(self, name="perform_rag"):
+        self.name = name
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self.counts = {}
+        self._lock = threading.Lock()
+        self.handler = _TraceCallbackHandler(self)
+
+    def _add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    @property
+    def seconds(self):
+        """Total seconds per span name (parallel spans of one name add up)."""
+        totals = {}
+        for s in list(self.spans):
+            totals[s.name] = totals.get(s.name, 0.0) + s.duration
+        return totals
+
+    @property
+    def llm_calls(self):
+        return sum(s.llm_calls for s in self.spans)
+
+    @property
+    def tokens(self):
+        """(tokens in, tokens out) over every span."""
+        return sum(s.tokens_in for s in self.spans), sum(s.tokens_out for s in self.spans)
+
+    @property
+    def cost(self):
+        return sum(s.cost for s in self.spans)
+
+    def subtree(self, root):
+        """`root` and every span nested under it."""
+        spans = list(self.spans)
+        keep = {root.span_id}
+        for s in sorted(spans, key=lambda s: s.start_ns):
+            if s.parent_id in keep:
+                keep.add(s.span_id)
+        return [s for s in spans if s.span_id in keep]
+
+    def rows(self):
+        """Flat rows for a waterfall chart, times in ms from the first span."""
+        if not self.spans:
+            return []
+        t0 = min(s.start_ns for s in self.spans)
+        depth = {}
+        rows = []
+        for s in sorted(self.spans, key=lambda s: s.start_ns):
+            depth[s.span_id] = depth.get(s.parent_id, -1) + 1
+            end = s.end_ns if s.end_ns is not None else time.time_ns()
+            rows.append({
+                "stage": s.name, "depth": depth[s.span_id],
+                "start_ms": (s.start_ns - t0) / 1e6, "end_ms": (end - t0) / 1e6,
+                "duration_ms": (end - s.start_ns) / 1e6,
+                "llm_calls": s.llm_calls, "tokens_in": s.tokens_in, "tokens_out": s.tokens_out,
+                "cost": s.cost,
+            })
+        return rows
+
+    def to_otel(self, service_name="ragscope"):
+        """OTLP/JSON (as accepted by the OpenTelemetry collector's HTTP receiver)."""
+        def attr(key, value):
+            if isinstance(value, bool):
+                return {"key": key, "value": {"boolValue": value}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            if isinstance(value, float):
+                return {"key": key, "value": {"doubleValue": value}}
+            return {"key": key, "value": {"stringValue": str(value)}}
+
+        spans = []
+        for s in list(self.spans):
+            attributes = {**s.attributes, "llm.calls": s.llm_calls, "llm.cache_hits": s.cache_hits,
+                          "llm.estimated_calls": s.estimated_calls,
+                          "llm.tokens.input": s.tokens_in, "llm.tokens.output": s.tokens_out,
+                          "llm.cost_usd": s.cost}
+            spans.append({
+                "traceId": self.trace_id,
+                "spanId": s.span_id,
+                "parentSpanId": s.parent_id or "",
+                "name": s.name,
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns if s.end_ns is not None else s.start_ns),
+                "attributes": [attr(k, v) for k, v in attributes.items()],
+            })
+        return {"resourceSpans": [{
+            "resource": {"attributes": [attr("service.name", service_name)]},
+            "scopeSpans": [{"scope": {"name": "ragscope.tracing"}, "spans": spans}],
+        }]}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_otel(**kwargs), indent=2)
+
+    @classmethod
+    def from_otel(cls, data, name="perform_rag"):
+        """Rebuild a Trace from to_otel() output, e.g. one returned by the query service."""
+        def value(v):
+            if "intValue" in v:
+                return int(v["intValue"])
+            return next(iter(v.values()), None)
+
+        trace = cls(name)
+        for resource in data.get("resourceSpans", []):
+            for scope in resource.get("scopeSpans", []):
+                for raw in scope.get("spans", []):
+                    attributes = {a["key"]: value(a["value"]) for a in raw.get("attributes", [])}
+                    span = Span(raw["name"], raw.get("parentSpanId") or None)
+                    span.span_id = raw["spanId"]
+                    span.start_ns = int(raw["startTimeUnixNano"])
+                    span.end_ns = int(raw["endTimeUnixNano"])
+                    span.llm_calls = attributes.pop("llm.calls", 0)
+                    span.cache_hits = attributes.pop("llm.cache_hits", 0)
+                    span.estimated_calls = attributes.pop("llm.estimated_calls", 0)
+                    span.tokens_in = attributes.pop("llm.tokens.input", 0)
+                    span.tokens_out = attributes.pop("llm.tokens.output", 0)
+                    span.cost = attributes.pop("llm.cost_usd", 0.0)
+                    span.attributes = attributes
+                    trace.trace_id = raw["traceId"]
+                    trace.spans.append(span)
+        return trace
+
+
+class _TraceCallbackHandler(BaseCallbackHandler):
+    """Attributes each LLM call (tokens and cost) to the span it was made in."""
+
+    # Cheap and thread-safe: for async runs, call it on the loop instead of an executor thread
+    run_inline = True
+
+    def __init__(self, trace):
+        self.trace = trace
+        self._runs = {}  # run_id -> (span, prompt text, model)
+
+    def _start(self, run_id, prompt_text, metadata):
+        span = _span.get()
+        if span is None:
+            return
+        model = (metadata or {}).get("ls_model_name")
+        with self.trace._lock:
+            self._runs[run_id] = (span, prompt_text, model)
+            span.llm_calls += 1
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        text = "\n".join(m.content for batch in messages for m in batch if isinstance(m.content, str))
+        self._start(run_id, text, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, "\n".join(prompts), metadata)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self.trace._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        span, prompt_text, model = run
+
+        for gens in response.generations:
+            for g in gens:
+                tokens_in, tokens_out, source = generation_usage(g, prompt_text)
+                with self.trace._lock:
+                    span.tokens_in += tokens_in
+                    span.tokens_out += tokens_out
+                    span.cost += price(model, tokens_in, tokens_out)
+                    span.cache_hits += source == "cache"
+                    span.estimated_calls += source == "estimate"
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self.trace._lock:
+            self._runs.pop(run_id, None)
+
+
+def _reset(var, token):
+    # A streaming generator closed by the garbage collector runs its finally
+    # blocks outside the context that set the var; nothing left to undo then
+    try:
+        var.reset(token)
+    except ValueError:
+        pass
+
+
+def current_trace():
+    return _trace.get()
+
+
+@contextmanager
+def activate(trace):
+    """Make `trace` the active trace for this block (no-op for None or if already active)."""
+    if trace is None or trace is _trace.get():
+        yield None
+        return
+    tokens = (_trace.set(trace), _llm_handler.set(trace.handler), _span.set(None))
+    try:
+        yield trace
+    finally:
+        _reset(_span, tokens[2])
+        _reset(_llm_handler, tokens[1])
+        _reset(_trace, tokens[0])
+
+
+@contextmanager
+def record_stages():
+    """Collect every `stage()` / `count()` made inside this block into a fresh Trace."""
+    with activate(Trace()) as trace:
+        yield trace
+
+
+@contextmanager
+def stage(name, **attributes):
+    """A child span of the innermost open span, if a trace is active."""
+    trace = _trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _span.get()
+    span = Span(name, parent.span_id if parent else None, attributes)
+    trace._add(span)
+    token = _span.set(span)
+    try:
+        yield span
+    finally:
+        span.end_ns = time.time_ns()
+        _reset(_span, token)
+
+
+def traced(name, fn, *args, **kwargs):
+    """fn(*args, **kwargs) inside a span; handy for work sent to the pool."""
+    with stage(name):
+        return fn(*args, **kwargs)
+
+
+def count(name, value):
+    trace = _trace.get()
+    if trace is not None:
+        with trace._lock:
+            trace.counts[name] = trace.counts.get(name, 0) + value
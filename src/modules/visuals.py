@@ -1,3 +1,4 @@
+import altair as alt
 import graphviz
 import streamlit as st
 
@@ -56,7 +57,7 @@ def render_tech_flowchart(tech_name, is_mobile=False):
         with graph.subgraph(name='cluster_scoring') as c:
             c.attr(label='Cross-Encoder / LLM Scoring Loop', color='#9333ea', style='solid')
             c.node('Pair', 'Input Pair\n(Query + Doc[i])')
-            c.node('AI', 'AI Model\n(Llama 3)', shape='component', fillcolor='#f3e8ff')
+            c.node('AI', 'AI Model\n(Llama 3 or MiniLM\nCross-Encoder)', shape='component', fillcolor='#f3e8ff')
             c.node('Score', 'Relevance Score\n(0.0 - 1.0)', shape='circle')
             c.edge('Pair', 'AI')
             c.edge('AI', 'Score')
@@ -75,18 +76,18 @@ def render_tech_flowchart(tech_name, is_mobile=False):
         
         with graph.subgraph(name='cluster_search') as c:
             c.attr(label='Step 1: Child Search', color='#cbd5e1')
-            c.node('Chunk', 'Small Chunk Found\n(id: 101_child_5)', shape='note', fillcolor='#fff1f2')
-            c.node('Meta', 'Metadata Lookup\n(parent_id: 101)', shape='box3d')
+            c.node('Chunk', 'Small Chunk Found\n(file: spells.txt, chunk 5)', shape='note', fillcolor='#fff1f2')
+            c.node('Meta', 'Adjacency Lookup\n(chunks 3-7 / section)', shape='box3d')
             c.edge('Chunk', 'Meta')
 
         with graph.subgraph(name='cluster_fetch') as c:
             c.attr(label='Step 2: Parent Retrieval', color='#cbd5e1')
-            c.node('Store', 'Doc Store / S3\n(Full Files)', shape='cylinder')
-            c.node('Full', 'Full Document\n(Content of ID 101)', shape='note', fillcolor='#dcfce7')
+            c.node('Store', 'In-Memory Chunk Index\n(offsets, no file I/O)', shape='cylinder')
+            c.node('Full', 'Stitched Parent\n(overlaps merged)', shape='note', fillcolor='#dcfce7')
             c.edge('Store', 'Full')
 
         graph.edge('Q', 'Chunk', label=' Vector Search')
-        graph.edge('Meta', 'Store', label=' Fetch ID')
+        graph.edge('Meta', 'Store', label=' Fetch Neighbours')
 
     # 4. Multi-Query (Detailed)
     elif tech_name == "Multi-Query":
@@ -101,7 +102,7 @@ def render_tech_flowchart(tech_name, is_mobile=False):
             c.node('Q3', 'Var 3: Related')
         
         graph.node('DB', 'Vector DB', shape='cylinder')
-        graph.node('Union', 'Set Union\n(Deduplication)', shape='diamond')
+        graph.node('Union', 'Reciprocal Rank\nFusion (by chunk id)', shape='diamond')
         graph.node('Final', 'Comprehensive Context', shape='note', fillcolor='#dcfce7')
 
         graph.edge('Q', 'LLM')
@@ -165,24 +166,58 @@ def render_tech_flowchart(tech_name, is_mobile=False):
     # 8. Sub-Query (Detailed)
     elif tech_name == "Sub-Query":
         graph.node('Q', 'Complex Query\n"Compare A vs B"', shape='oval')
-        graph.node('Plan', 'Decomposition Planner', shape='component')
+        graph.node('Plan', 'Decomposition Planner\n(sub-questions + depends_on)', shape='component')
         
         with graph.subgraph(name='cluster_steps') as c:
-            c.attr(label='Sequential Execution')
+            c.attr(label='DAG Execution (independent steps in parallel)')
             c.node('S1', 'Step 1:\nFind info on A')
-            c.node('Ctx1', 'Context A', shape='note')
+            c.node('Ctx1', 'Answer A', shape='note')
             c.node('S2', 'Step 2:\nFind info on B')
-            c.node('Ctx2', 'Context B', shape='note')
+            c.node('Ctx2', 'Answer B', shape='note')
+            c.node('S3', 'Step 3 (needs 1, 2):\nCompare A and B')
+            c.node('Ctx3', 'Answer 3', shape='note')
             
             c.edge('S1', 'Ctx1', label=' Search')
-            c.edge('Ctx1', 'S2', label=' Augment')
             c.edge('S2', 'Ctx2', label=' Search')
+            c.edge('Ctx1', 'S3', label=' Input')
+            c.edge('Ctx2', 'S3', label=' Input')
+            c.edge('S3', 'Ctx3', label=' Search')
         
         graph.node('Ans', 'Final Synthesis', shape='diamond', fillcolor='#dcfce7')
 
         graph.edge('Q', 'Plan')
         graph.edge('Plan', 'S1')
-        graph.edge('Ctx2', 'Ans')
+        graph.edge('Plan', 'S2')
+        graph.edge('Ctx3', 'Ans')
 
     # Render
-    st.graphviz_chart(graph, use_container_width=True)
\ No newline at end of file
+    st.graphviz_chart(graph, use_container_width=True)
+
+def render_trace_waterfall(trace):
+    """
+    Waterfall (Gantt) of a tracing.Trace: one bar per span, nested stages
+    indented under their parent, parallel spans of a stage on one row.
+    """
+    rows = trace.rows()
+    if not rows:
+        st.caption("No trace recorded.")
+        return
+
+    for r in rows:
+        r["label"] = "\u2003" * r["depth"] + r["stage"]
+        r["kind"] = "LLM" if r["llm_calls"] else "Local"
+
+    chart = alt.Chart(alt.Data(values=rows)).mark_bar(cornerRadius=3, height=14).encode(
+        x=alt.X("start_ms:Q", title="ms"),
+        x2="end_ms:Q",
+        y=alt.Y("label:N", title=None, sort=alt.EncodingSortField("start_ms", op="min"),
+                axis=alt.Axis(labelLimit=220)),
+        color=alt.Color("kind:N", scale=alt.Scale(domain=["LLM", "Local"], range=["#6366f1", "#10b981"]),
+                        legend=alt.Legend(title=None, orient="bottom")),
+        tooltip=[
+            alt.Tooltip("stage:N"), alt.Tooltip("duration_ms:Q", format=".1f"),
+            alt.Tooltip("llm_calls:Q"), alt.Tooltip("tokens_in:Q"), alt.Tooltip("tokens_out:Q"),
+        ],
+    ).properties(height=max(120, 24 * len({r["label"] for r in rows})))
+
+    st.altair_chart(chart, use_container_width=True)
@@ -0,0 +1,324 @@
+"""
+Headless query service: the RAG pipeline as a JSON-over-HTTP ASGI app.
+
+    python src/server.py --workers 4
+    uvicorn server:app --app-dir src --workers 4
+
+Every worker process loads the embedding model, the Chroma client, the
+corpus snapshot / BM25 index and the docstore once at startup and shares
+them across all of its requests; pipelines run concurrently on the worker's
+event loop. Scale out by adding workers or hosts behind a load balancer.
+
+    POST /query   {"query", "techniques", "reranker", "compressor", "cache"}
+                  or {"batch": [{...}, ...]} to send several questions at once
+    POST /ab      {"query", "techs_a", "techs_b", "reranker_a", "reranker_b"}
+    POST /ingest  incremental ingest of data/ (send to one worker; 409 while running)
+    GET  /health
+
+The Groq key is read from the X-Groq-Api-Key header, else GROQ_API_KEY.
+/ingest is CPU-heavy, so it is off unless RAGSCOPE_INGEST_TOKEN is set on
+the server, and then needs that token in the X-Ingest-Token header.
+"""
+import argparse
+import asyncio
+import hmac
+import json
+import os
+import sys
+from functools import lru_cache, partial
+
+# Fix path to allow importing modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from modules.config import (
+    COLLECTION_NAME, DB_PATH, EMBEDDING_MODEL, TECHNIQUE_INFO, RERANKER_BACKENDS, COMPRESSION_BACKENDS,
+    DEFAULT_RERANKER, DEFAULT_COMPRESSOR, SERVER_PORT, SERVER_MAX_CONCURRENCY, SERVER_MAX_BATCH,
+    SERVER_INGEST_TOKEN
+)
+from modules.answer_cache import AnswerCache, is_cache_hit, normalize_query
+from modules.concurrency import in_pool
+from modules.cost import load_tokenizer
+from modules.database import get_embedding, load_vector_db, get_corpus_snapshot, get_bm25_index, get_docstore
+from modules.llm import get_llm
+from modules.rag_pipeline import aperform_rag, acompare_pipelines
+from modules.tracing import Trace
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# Per worker process, set up at startup (asyncio primitives need the server's loop)
+_state = {}
+
+
+# --- Shared resources ---
+
+def _load_resources():
+    """Vector DB, snapshot, BM25 index and docstore, loaded once per process."""
+    vector_db = load_vector_db(COLLECTION_NAME)
+    snapshot = get_corpus_snapshot(vector_db)
+    get_bm25_index(COLLECTION_NAME, snapshot)
+    get_docstore()
+    return vector_db, len(snapshot.ids)
+
+
+async def _vector_db():
+    try:
+        vector_db = await in_pool(load_vector_db, COLLECTION_NAME)
+    except FileNotFoundError as e:
+        raise ApiError(503, str(e))
+    return vector_db
+
+
+@lru_cache(maxsize=16)
+def _llm(api_key, cache=True):
+    return get_llm(api_key, cache)
+
+
+def _api_key(headers):
+    key = headers.get("x-groq-api-key") or os.environ.get("GROQ_API_KEY")
+    if not key:
+        raise ApiError(401, "Missing Groq API key (X-Groq-Api-Key header or GROQ_API_KEY).")
+    return key
+
+
+def _check_ingest_token(headers):
+    if not SERVER_INGEST_TOKEN:
+        raise ApiError(403, "Ingest is disabled; set RAGSCOPE_INGEST_TOKEN on the server to enable it.")
+    token = headers.get("x-ingest-token", "")
+    if not hmac.compare_digest(token.encode("utf-8"), SERVER_INGEST_TOKEN.encode("utf-8")):
+        raise ApiError(401, "Missing or wrong X-Ingest-Token header.")
+
+
+# --- Request parsing / response building ---
+
+def _techniques(body, field):
+    techs = body.get(field) or []
+    if not isinstance(techs, list) or any(t not in TECHNIQUE_INFO for t in techs):
+        raise ApiError(400, f"'{field}' must be a list of: {', '.join(TECHNIQUE_INFO)}")
+    return techs
+
+
+def _choice(body, field, choices, default):
+    value = body.get(field, default)
+    if value not in choices:
+        raise ApiError(400, f"'{field}' must be one of: {', '.join(choices)}")
+    return value
+
+
+def _query(body):
+    query = body.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise ApiError(400, "'query' must be a non-empty string")
+    return query
+
+
+def _docs(docs):
+    return [{"page_content": d.page_content, "metadata": d.metadata} for d in docs]
+
+
+def _result(result, trace=None):
+    answer, docs, lat, tokens, cost, logs = result
+    out = {"answer": answer, "docs": _docs(docs), "lat": lat, "tokens": tokens, "cost": cost,
+           "logs": logs, "cached": is_cache_hit(logs)}
+    if trace is not None:
+        out["trace"] = trace.to_otel()
+    return out
+
+
+# --- Endpoints ---
+
+async def _answer(body, api_key):
+    """One question. Identical questions already in flight share that run."""
+    if not isinstance(body, dict):
+        raise ApiError(400, "each question must be a JSON object")
+    query = _query(body)
+    techs = _techniques(body, "techniques")
+    reranker = _choice(body, "reranker", RERANKER_BACKENDS, DEFAULT_RERANKER)
+    compressor = _choice(body, "compressor", COMPRESSION_BACKENDS, DEFAULT_COMPRESSOR)
+    use_cache = bool(body.get("cache", True))
+
+    key = (normalize_query(query), frozenset(techs), reranker, compressor, use_cache, api_key)
+    inflight = _state["inflight"]
+    if key not in inflight:
+        inflight[key] = asyncio.ensure_future(_run_query(query, techs, reranker, compressor, use_cache, api_key))
+        inflight[key].add_done_callback(lambda _: inflight.pop(key, None))
+    # shield: one client disconnecting must not cancel the run the others wait on
+    return await asyncio.shield(inflight[key])
+
+
+async def _run_query(query, techs, reranker, compressor, use_cache, api_key):
+    vector_db = await _vector_db()
+    trace = Trace()
+    async with _state["gate"]:
+        result = await aperform_rag(
+            query, vector_db, _llm(api_key), techs, reranker,
+            answer_cache=_state["answer_cache"] if use_cache else None, trace=trace, compressor=compressor
+        )
+    return _result(result, trace)
+
+
+async def query(body, headers):
+    api_key = _api_key(headers)
+    if "batch" not in body:
+        return await _answer(body, api_key)
+
+    batch = body["batch"]
+    if not isinstance(batch, list) or not 0 < len(batch) <= SERVER_MAX_BATCH:
+        raise ApiError(400, f"'batch' must be a list of 1-{SERVER_MAX_BATCH} questions")
+    results = await asyncio.gather(*(_answer(item, api_key) for item in batch), return_exceptions=True)
+    out = []
+    for r in results:
+        if isinstance(r, ApiError):
+            out.append({"error": str(r), "status": r.status})
+        elif isinstance(r, Exception):
+            out.append({"error": f"{type(r).__name__}: {r}", "status": 500})
+        else:
+            out.append(r)
+    return {"results": out}
+
+
+async def ab(body, headers):
+    llm = _llm(_api_key(headers), cache=False)  # A/B compares real latency, no cache hits
+    query_text = _query(body)
+    techs_a, techs_b = _techniques(body, "techs_a"), _techniques(body, "techs_b")
+    reranker_a = _choice(body, "reranker_a", RERANKER_BACKENDS, DEFAULT_RERANKER)
+    reranker_b = _choice(body, "reranker_b", RERANKER_BACKENDS, DEFAULT_RERANKER)
+    vector_db = await _vector_db()
+    async with _state["gate"]:
+        res_a, res_b, shared = await acompare_pipelines(
+            query_text, vector_db, llm, techs_a, techs_b, reranker_a, reranker_b
+        )
+    return {"a": _result(res_a), "b": _result(res_b), "shared": shared}
+
+
+def _run_ingest(workers):
+    from langchain_chroma import Chroma
+    from langchain_huggingface import HuggingFaceEmbeddings
+    from modules.ingest_engine import run_ingest
+
+    collection = Chroma(persist_directory=DB_PATH, collection_name=COLLECTION_NAME)._collection
+    # In-process ingest reuses the worker's model; embedding processes each load their own
+    factory = get_embedding if workers <= 1 else partial(HuggingFaceEmbeddings, model_name=EMBEDDING_MODEL)
+    stats = run_ingest(collection, factory, workers=workers)
+    # Snapshot, BM25 index and docstore are keyed on their version: the next query reloads them
+    _load_resources()
+    return stats
+
+
+async def ingest(body, headers):
+    _check_ingest_token(headers)
+    lock = _state["ingest_lock"]
+    if lock.locked():
+        raise ApiError(409, "An ingest is already running.")
+    workers = body.get("workers", 1)
+    if not isinstance(workers, int) or workers < 1:
+        raise ApiError(400, "'workers' must be a positive integer")
+    async with lock:
+        stats = await in_pool(_run_ingest, workers)
+    return {
+        "files": stats.files, "changed": stats.changed, "removed": stats.removed,
+        "chunks": stats.chunks, "relabelled": stats.relabelled, "deleted": stats.deleted,
+        "startup": stats.startup, "elapsed": stats.elapsed, "chunks_per_sec": stats.chunks_per_sec,
+    }
+
+
+async def health(body, headers):
+    try:
+        vector_db, chunks = await in_pool(_load_resources)
+    except FileNotFoundError:
+        return {"status": "no database", "pid": os.getpid()}
+    return {"status": "ok", "pid": os.getpid(), "chunks": chunks,
+            "embeddings": getattr(vector_db.embeddings, "counts", None)}
+
+
+ROUTES = {
+    ("POST", "/query"): query,
+    ("POST", "/ab"): ab,
+    ("POST", "/ingest"): ingest,
+    ("GET", "/health"): health,
+}
+
+
+# --- ASGI plumbing ---
+
+async def _read_json(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    raw = b"".join(chunks)
+    if not raw:
+        return {}
+    try:
+        body = json.loads(raw)
+    except ValueError:
+        raise ApiError(400, "Request body must be JSON.")
+    if not isinstance(body, dict):
+        raise ApiError(400, "Request body must be a JSON object.")
+    return body
+
+
+async def _respond(send, status, payload):
+    data = json.dumps(payload, default=str).encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(data)).encode())]})
+    await send({"type": "http.response.body", "body": data})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            _state.update(
+                gate=asyncio.Semaphore(SERVER_MAX_CONCURRENCY), ingest_lock=asyncio.Lock(),
+                inflight={}, answer_cache=AnswerCache(),
+            )
+            await in_pool(load_tokenizer, True)  # fetched once here, never on the query path
+            try:
+                _, chunks = await in_pool(_load_resources)
+                print(f"🚀 Worker {os.getpid()} ready: {chunks} chunks loaded.")
+            except FileNotFoundError:
+                print(f"⚠️ Worker {os.getpid()}: no database yet, run src/ingest.py "
+                      f"(or POST /ingest with RAGSCOPE_INGEST_TOKEN set) to build it.")
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    try:
+        handler = ROUTES.get((scope["method"], scope["path"]))
+        if handler is None:
+            raise ApiError(404, f"No route for {scope['method']} {scope['path']}")
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        status, payload = 200, await handler(await _read_json(receive), headers)
+    except ApiError as e:
+        status, payload = e.status, {"error": str(e)}
+    except Exception as e:
+        status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+    await _respond(send, status, payload)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the RAG pipeline over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes (one model/index copy each)")
+    args = parser.parse_args()
+    uvicorn.run("server:app", app_dir=os.path.dirname(os.path.abspath(__file__)),
+                host=args.host, port=args.port, workers=args.workers)
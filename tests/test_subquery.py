@@ -0,0 +1,54 @@
+import json
+import os
+import sys
+
+# Fix path to allow importing modules
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from modules.subquery import parse_plan
+
+
+def plan_of(items):
+    return parse_plan(json.dumps(items), "original question")
+
+
+def test_dependencies_point_at_earlier_questions():
+    plan = plan_of([
+        {"id": 1, "question": "Who?", "depends_on": []},
+        {"id": 2, "question": "Where?", "depends_on": [1]},
+        {"id": 3, "question": "Why?", "depends_on": [1, 2, 3, 4]},
+    ])
+    assert [sq.depends_on for sq in plan] == [[], [1], [1, 2]]
+
+
+def test_string_and_numeric_ids_match():
+    plan = plan_of([
+        {"id": "1", "question": "Who?"},
+        {"id": 2.0, "question": "Where?", "depends_on": [1]},
+        {"id": 3, "question": "Why?", "depends_on": ["2"]},
+    ])
+    assert [sq.depends_on for sq in plan] == [[], [1], [2]]
+
+
+def test_unhashable_dependencies_are_ignored():
+    plan = plan_of([
+        {"id": 1, "question": "Who?"},
+        {"id": 2, "question": "Where?", "depends_on": [{"id": 1}, [1], 1]},
+        {"id": 3, "question": "Why?", "depends_on": {"id": 2}},
+    ])
+    assert [sq.depends_on for sq in plan] == [[], [1], []]
+
+
+def test_unhashable_ids_are_ignored():
+    plan = plan_of([
+        {"id": [1], "question": "Who?"},
+        {"id": {"n": 2}, "question": "Where?", "depends_on": [[1]]},
+        {"id": None, "question": "Why?", "depends_on": [None, True]},
+    ])
+    assert [sq.question for sq in plan] == ["Who?", "Where?", "Why?"]
+    assert all(sq.depends_on == [] for sq in plan)
+
+
+def test_falls_back_to_numbered_lines_then_the_question():
+    assert [sq.question for sq in parse_plan("1. Who?\n2) Where?", "q")] == ["Who?", "Where?"]
+    assert [sq.question for sq in parse_plan("no plan here", "q")] == ["q"]